@@ -0,0 +1,319 @@
+"""
+alien_env.py
+Alien Invasion Training Environments
+Purpose: wrap headless games in a gym-style reset()/step() interface,
+one at a time or many in lockstep with NumPy observations, so agents
+can be trained without a window
+
+Usage:
+    env = AlienEnv()
+    observation = env.reset()
+    observation, reward, done, info = env.step(AlienEnv.FIRE)
+
+    envs = VecAlienEnv(64, processes=8)
+    observations = envs.reset()
+    observations, rewards, dones, infos = envs.step(actions)
+
+    python alien_env.py --envs 64 --processes 8 --steps 2000
+"""
+
+import argparse
+import multiprocessing
+import os
+import random
+from time import perf_counter
+
+# The game loads its assets by relative path.
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import numpy as np
+from alien_invasionGame import AlienInvasion
+
+
+class AlienEnv:
+    """
+    A class to play one headless game one step at a time.
+
+    An action is a number from 0 to 5 (see ACTIONS): the ship moves up,
+    moves down or holds still, and may fire. Each step runs frame_skip
+    simulation ticks. The reward is the score gained, and the game is
+    done when the last ship is lost (or after max_ticks ticks).
+
+    Observations are float32 arrays scaled to about 0..1: the ship's
+    height, ships left and fleet direction, then (x, y, present) for each
+    bullet slot and each alien slot. Unused slots are all zeros.
+    """
+
+    NOOP, UP, DOWN, FIRE, UP_FIRE, DOWN_FIRE = range(6)
+    # (up, down, fire) for each action.
+    ACTIONS = (
+        (False, False, False),
+        (True, False, False),
+        (False, True, False),
+        (False, False, True),
+        (True, False, True),
+        (False, True, True),
+    )
+
+    def __init__(self, settings=None, frame_skip=1, max_ticks=None):
+        """Create the game. settings replaces the default Settings."""
+        self.game = AlienInvasion(headless=True, settings=settings)
+        self.settings = self.game.settings
+        self.frame_skip = frame_skip
+        self.max_ticks = max_ticks
+        self.step_time = 1.0 / self.settings.sim_rate
+
+        self.bullet_slots = self.settings.bullets_allowed
+        self.alien_slots = self.settings.fleet_size
+        self.observation_size = 3 + 3 * (self.bullet_slots + self.alien_slots)
+        self.action_count = len(self.ACTIONS)
+
+        self.last_score = 0
+        self.ticks = 0
+
+    def reset(self, out=None):
+        """Start a new game, as the Play button does, and observe it."""
+        self.game._start_game()
+        self.last_score = 0
+        self.ticks = 0
+        return self.observe(out)
+
+    def step(self, action, out=None):
+        """
+        Play action for frame_skip ticks. Returns the observation, the
+        reward, whether the game is done, and a dict of info.
+        """
+        game = self.game
+        up, down, fire = self.ACTIONS[action]
+        game.ship.moving_up = up
+        game.ship.moving_down = down
+        if fire:
+            game._fire_bullet()
+
+        for _ in range(self.frame_skip):
+            game._update_simulation(self.step_time)
+            self.ticks += 1
+            if game.stats.state == 'game_over':
+                break
+
+        score = game.stats.score
+        reward = score - self.last_score
+        self.last_score = score
+
+        game_over = game.stats.state == 'game_over'
+        truncated = (not game_over and self.max_ticks is not None
+                     and self.ticks >= self.max_ticks)
+        info = {'score': score, 'level': game.stats.level,
+                'ships_left': game.stats.ships_left, 'ticks': self.ticks,
+                'truncated': truncated}
+        return self.observe(out), reward, game_over or truncated, info
+
+    def observe(self, out=None):
+        """Fill out (or a new array) with the current observation."""
+        if out is None:
+            out = np.zeros(self.observation_size, dtype=np.float32)
+        else:
+            out[:] = 0.0
+        game = self.game
+        width = float(self.settings.screen_width)
+        height = float(self.settings.screen_height)
+
+        out[0] = game.ship.rect.centery / height
+        out[1] = game.stats.ships_left / max(1, self.settings.ship_limit)
+        out[2] = self.settings.fleet_direction
+
+        index = 3
+        for bullet in game.bullets.sprites()[:self.bullet_slots]:
+            out[index:index + 3] = (bullet.rect.centerx / width,
+                                    bullet.rect.centery / height, 1.0)
+            index += 3
+
+        aliens = out[3 + 3 * self.bullet_slots:].reshape(-1, 3)
+        if self.settings.fleet_backend == 'numpy':
+            fleet = game.aliens
+            alive = fleet.alive
+            count = min(int(alive.sum()), self.alien_slots)
+            aliens[:count, 0] = (fleet.x[alive][:count]
+                                 + fleet.width[alive][:count] / 2) / width
+            aliens[:count, 1] = (fleet.y[alive][:count]
+                                 + fleet.height[alive][:count] / 2) / height
+            aliens[:count, 2] = 1.0
+        else:
+            for row, alien in zip(aliens, game.aliens.sprites()):
+                row[0] = alien.rect.centerx / width
+                row[1] = alien.rect.centery / height
+                row[2] = 1.0
+        return out
+
+
+class VecAlienEnv:
+    """
+    A class to step many games in lockstep, with batched observations.
+
+    Games that finish are reset straight away; their last observation
+    is in info['final_observation']. With processes above 0, the games
+    are split between that many worker processes so every core plays.
+    """
+
+    def __init__(self, num_envs, settings=None, frame_skip=1,
+                 max_ticks=None, processes=0):
+        """Create num_envs games, here or in worker processes."""
+        self.num_envs = num_envs
+        self.workers = []
+        self.envs = []
+
+        if processes:
+            # Hand out the games as evenly as possible.
+            counts = [num_envs // processes
+                      + (1 if i < num_envs % processes else 0)
+                      for i in range(min(processes, num_envs))]
+            for count in counts:
+                parent, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(
+                    target=_worker, daemon=True,
+                    args=(child, count, settings, frame_skip, max_ticks))
+                process.start()
+                child.close()
+                self.workers.append((parent, process, count))
+            # Every worker reports the same sizes once its games are up.
+            for conn, _, _ in self.workers:
+                size, actions = conn.recv()
+        else:
+            self.envs = [AlienEnv(settings, frame_skip, max_ticks)
+                         for _ in range(num_envs)]
+            size = self.envs[0].observation_size
+            actions = self.envs[0].action_count
+
+        self.observation_size = size
+        self.action_count = actions
+        self.observations = np.zeros((num_envs, size), dtype=np.float32)
+        self.rewards = np.zeros(num_envs, dtype=np.float32)
+        self.dones = np.zeros(num_envs, dtype=bool)
+
+    def reset(self):
+        """Start every game over, and return the batch of observations."""
+        if self.workers:
+            for conn, _, _ in self.workers:
+                conn.send(('reset', None))
+            self._gather()
+        else:
+            for env, out in zip(self.envs, self.observations):
+                env.reset(out)
+        return self.observations
+
+    def step(self, actions):
+        """
+        Play one action per game. Returns arrays of observations, rewards
+        and done flags, and a list of info dicts.
+        """
+        if self.workers:
+            start = 0
+            for conn, _, count in self.workers:
+                conn.send(('step', actions[start:start + count]))
+                start += count
+            return self._gather()
+
+        infos = _step_all(self.envs, actions, self.observations,
+                          self.rewards, self.dones)
+        return self.observations, self.rewards, self.dones, infos
+
+    def _gather(self):
+        """Collect each worker's slice of the batch."""
+        infos = []
+        start = 0
+        for conn, _, count in self.workers:
+            observations, rewards, dones, worker_infos = conn.recv()
+            stop = start + count
+            self.observations[start:stop] = observations
+            self.rewards[start:stop] = rewards
+            self.dones[start:stop] = dones
+            infos.extend(worker_infos)
+            start = stop
+        return self.observations, self.rewards, self.dones, infos
+
+    def close(self):
+        """Stop the worker processes."""
+        for conn, process, _ in self.workers:
+            conn.send(('close', None))
+            process.join(timeout=5.0)
+        self.workers = []
+
+
+def _step_all(envs, actions, observations, rewards, dones):
+    """Step each env into the batch arrays, resetting finished games."""
+    infos = []
+    for index, (env, action) in enumerate(zip(envs, actions)):
+        out = observations[index]
+        _, reward, done, info = env.step(int(action), out)
+        if done:
+            info['final_observation'] = out.copy()
+            env.reset(out)
+        rewards[index] = reward
+        dones[index] = done
+        infos.append(info)
+    return infos
+
+
+def _worker(conn, count, settings, frame_skip, max_ticks):
+    """Run count games in a worker process for VecAlienEnv."""
+    envs = [AlienEnv(settings, frame_skip, max_ticks) for _ in range(count)]
+    observations = np.zeros((count, envs[0].observation_size),
+                            dtype=np.float32)
+    rewards = np.zeros(count, dtype=np.float32)
+    dones = np.zeros(count, dtype=bool)
+    conn.send((envs[0].observation_size, envs[0].action_count))
+
+    while True:
+        command, actions = conn.recv()
+        if command == 'step':
+            infos = _step_all(envs, actions, observations, rewards, dones)
+            conn.send((observations, rewards, dones, infos))
+        elif command == 'reset':
+            for env, out in zip(envs, observations):
+                env.reset(out)
+            dones[:] = False
+            conn.send((observations, rewards, dones, []))
+        else:
+            conn.close()
+            return
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--envs', type=int, default=16,
+                        help="games stepped in lockstep")
+    parser.add_argument('--processes', type=int, default=0,
+                        help="worker processes (0 steps games here)")
+    parser.add_argument('--steps', type=int, default=1000,
+                        help="batched steps to time")
+    parser.add_argument('--frame-skip', type=int, default=1,
+                        help="simulation ticks per step")
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    envs = VecAlienEnv(args.envs, frame_skip=args.frame_skip,
+                       processes=args.processes)
+    envs.reset()
+
+    start = perf_counter()
+    total_reward = 0.0
+    games = 0
+    for _ in range(args.steps):
+        actions = [rng.randrange(envs.action_count)
+                   for _ in range(args.envs)]
+        _, rewards, dones, _ = envs.step(actions)
+        total_reward += float(rewards.sum())
+        games += int(dones.sum())
+    elapsed = perf_counter() - start
+    envs.close()
+
+    steps = args.steps * args.envs
+    print("{} steps in {:.2f} s: {:.0f} steps/s, {} games finished, "
+          "reward {:.0f}".format(steps, elapsed, steps / elapsed, games,
+                                 total_reward))
+
+
+if __name__ == '__main__':
+    main()
@@ -6,12 +6,36 @@ Purpose: create a video game with a ship shooting beams at aliens and staying al
 Date: 8/4/25
 """
 
+import csv
+import hashlib
+import json
+import os
+import random
+import struct
 import sys
+import threading
+import zlib
+from collections import deque
+from datetime import date
+from functools import lru_cache
+from math import copysign
+from time import perf_counter
 import pygame
 from pygame.sprite import Sprite, Group
-from time import sleep
 import pygame.font
 
+# NumPy is only needed for the 'numpy' fleet backend.
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# tomllib (Python 3.11+) is only needed for TOML settings profiles.
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
 class Button:
     def __init__(self, ai_game, msg, width=200, height=50, button_color=(0, 255, 0), text_color=(255, 255, 255)):
         self.screen = ai_game.screen
@@ -22,7 +46,7 @@ class Button:
         self.height = height
         self.button_color = button_color
         self.text_color = text_color
-        self.font = pygame.font.SysFont(None, 48)
+        self.font = ai_game.fonts.get(32)
 
         # Build the button's rect object and center it.
         self.rect = pygame.Rect(0, 0, self.width, self.height)
@@ -36,38 +60,725 @@ class Button:
         self.msg_image = self.font.render(msg, True, self.text_color, self.button_color)
         self.msg_image_rect = self.msg_image.get_rect()
         self.msg_image_rect.center = self.rect.center
+        
+        # A plain face for renderers that blit the button instead of filling.
+        self.face_image = pygame.Surface(self.rect.size)
+        self.face_image.fill(self.button_color)
+
+    def blit_items(self):
+        """Return the (image, rect) pairs that make up the button."""
+        return [(self.face_image, self.rect),
+                (self.msg_image, self.msg_image_rect)]
 
     def draw_button(self):
         # Draw blank button and then draw message.
         self.screen.fill(self.button_color, self.rect)
         self.screen.blit(self.msg_image, self.msg_image_rect)
 
+class AssetCache:
+    """
+    A class to load each image once and hand out shared, scaled copies.
+
+    Images are read ready-made from baked_dir when its manifest has them
+    and the source file's SHA-256 still matches. Otherwise the source is
+    scaled and rotated here, and, if bake is True, saved back to
+    baked_dir so the next start can skip that work.
+    """
+
+    # Every image the game draws, as (path, scale, rotation).
+    # bake_assets.py bakes these ahead of time.
+    SPRITES = (
+        ('2ndchip.png', 0.15, 0),
+        ('2ndchip.png', 0.15, 90),
+        ('2ndlazer.png', 0.1, 0),
+        ('2ndALIENship.png', 0.03, 0),
+        # The background art, at Background.ART_SCALE.
+        ('Starbasesnow.png', 0.55, 0),
+    )
+    MANIFEST_VERSION = 1
+
+    def __init__(self, baked_dir='Assets/baked', bake=False):
+        """Initialize the empty caches and the hit/miss counters."""
+        # Decoded source images, keyed by path.
+        self._originals = {}
+        # Final images, keyed by (path, scale, rotation).
+        self._images = {}
+        # SHA-256 of each source file, keyed by path.
+        self._hashes = {}
+        # Collision masks of final images, keyed like _images.
+        self._masks = {}
+        
+        self.baked_dir = baked_dir
+        self.bake_missing = bake
+        self.manifest_path = os.path.join(baked_dir, 'manifest.json')
+        self.manifest = self._load_manifest()
+
+        self.hits = 0
+        self.misses = 0
+        self.loads = 0
+        self.baked_loads = 0
+        self.bakes = 0
+
+    def _load_manifest(self):
+        """Return the baked image entries, or none if there is no manifest."""
+        try:
+            with open(self.manifest_path) as f:
+                manifest = json.load(f)
+        except (OSError, ValueError):
+            return {}
+        if manifest.get('version') != self.MANIFEST_VERSION:
+            return {}
+        return manifest.get('images', {})
+
+    @staticmethod
+    def baked_name(path, scale, rotation):
+        """Return the manifest key and file name for a baked image."""
+        stem = os.path.splitext(os.path.basename(path))[0]
+        return ("{}|{}|{}".format(path, scale, rotation),
+                "{}@{}r{}.png".format(stem, scale, rotation))
+
+    def source_hash(self, path):
+        """Return the SHA-256 of a source file, or None if it's missing."""
+        if path not in self._hashes:
+            try:
+                with open(path, 'rb') as f:
+                    self._hashes[path] = hashlib.sha256(f.read()).hexdigest()
+            except OSError:
+                self._hashes[path] = None
+        return self._hashes[path]
+
+    def is_fresh(self, path, scale, rotation):
+        """
+        True if a baked image exists and was made from the current source.
+        A build shipped without its source images trusts the manifest.
+        """
+        key, _ = self.baked_name(path, scale, rotation)
+        entry = self.manifest.get(key)
+        if entry is None:
+            return False
+        if not os.path.exists(os.path.join(self.baked_dir, entry['file'])):
+            return False
+        source_hash = self.source_hash(path)
+        return source_hash is None or source_hash == entry['source_hash']
+
+    def _load_baked(self, path, scale, rotation):
+        """Return the baked image, or None if it's missing or stale."""
+        if not self.is_fresh(path, scale, rotation):
+            return None
+        key, _ = self.baked_name(path, scale, rotation)
+        baked_path = os.path.join(self.baked_dir, self.manifest[key]['file'])
+        try:
+            image = pygame.image.load(baked_path)
+        except (pygame.error, FileNotFoundError):
+            return None
+        if pygame.display.get_surface() is not None:
+            image = image.convert_alpha()
+        self.baked_loads += 1
+        return image
+
+    def bake(self, path, scale=1.0, rotation=0, force=False):
+        """
+        Save the image for (path, scale, rotation) to baked_dir and record
+        it in the manifest, unless a fresh one is there already. Returns
+        True if it baked.
+        """
+        if not force and self.is_fresh(path, scale, rotation):
+            return False
+        if self.source_hash(path) is None:
+            raise FileNotFoundError(path)
+        self._save_baked(path, scale, rotation,
+                         self._render(path, scale, rotation))
+        return True
+
+    def _save_baked(self, path, scale, rotation, image):
+        """Write image to baked_dir and record it in the manifest."""
+        key, file_name = self.baked_name(path, scale, rotation)
+        os.makedirs(self.baked_dir, exist_ok=True)
+        pygame.image.save(image, os.path.join(self.baked_dir, file_name))
+        self.manifest[key] = {
+            'file': file_name,
+            'source': path,
+            'source_hash': self.source_hash(path),
+            'size': list(image.get_size()),
+        }
+        self.save_manifest()
+        self.bakes += 1
+
+    def save_manifest(self):
+        """Write the manifest to a temporary file, then rename it into place."""
+        temp_path = self.manifest_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'version': self.MANIFEST_VERSION,
+                       'images': self.manifest}, f, indent=2, sort_keys=True)
+        os.replace(temp_path, self.manifest_path)
+
+    def _load_original(self, path):
+        """Decode an image file, only the first time it is asked for."""
+        original = self._originals.get(path)
+        if original is None:
+            original = pygame.image.load(path)
+            # Match the display's pixel format once a display exists.
+            if pygame.display.get_surface() is not None:
+                original = original.convert_alpha()
+            self._originals[path] = original
+            self.loads += 1
+        return original
+
+    def image(self, path, scale=1.0, rotation=0):
+        """
+        Return the shared Surface for path, scaled by scale and then
+        rotated by rotation degrees. Callers must not draw on it.
+        """
+        key = (path, scale, rotation)
+        image = self._images.get(key)
+        if image is not None:
+            self.hits += 1
+            return image
+
+        self.misses += 1
+        image = self._load_baked(path, scale, rotation)
+        if image is None:
+            image = self._render(path, scale, rotation)
+            if self.bake_missing and self.source_hash(path) is not None:
+                # Bring a missing or stale bake up to date for next time.
+                try:
+                    self._save_baked(path, scale, rotation, image)
+                except (OSError, pygame.error):
+                    print("Could not bake " + path)
+        self._images[key] = image
+        return image
+
+    def mask(self, path, scale=1.0, rotation=0):
+        """
+        Return the shared collision Mask for image(path, scale, rotation),
+        made once per image. Callers must not change it.
+        """
+        key = (path, scale, rotation)
+        mask = self._masks.get(key)
+        if mask is None:
+            mask = pygame.mask.from_surface(self.image(path, scale, rotation))
+            self._masks[key] = mask
+        return mask
+
+    def _render(self, path, scale, rotation):
+        """Scale and rotate the source image."""
+        image = self._load_original(path)
+        if scale != 1.0:
+            new_width = int(image.get_width() * scale)
+            new_height = int(image.get_height() * scale)
+            image = pygame.transform.smoothscale(image, (new_width, new_height))
+        if rotation:
+            image = pygame.transform.rotate(image, rotation)
+        return image
+
+    def get_stats(self):
+        """Return the cache counters as a dictionary."""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'loads': self.loads,
+            'baked_loads': self.baked_loads,
+            'bakes': self.bakes,
+            'cached_images': len(self._images),
+            'cached_masks': len(self._masks),
+        }
+
+class FontRegistry:
+    """A class to load the bundled font once per size and share it."""
+
+    def __init__(self, path='Assets/Fonts/Silkscreen/Silkscreen-Regular.ttf'):
+        """Remember where the font lives; nothing is loaded yet."""
+        self.path = path
+        self.fonts = {}
+
+    def get(self, size):
+        """Return the shared Font for size, loading it the first time."""
+        font = self.fonts.get(size)
+        if font is None:
+            try:
+                font = pygame.font.Font(self.path, size)
+            except (OSError, FileNotFoundError):
+                print("Could not load font " + self.path)
+                font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+
+class SoundManager:
+    """
+    A class to play sound effects on reserved mixer channels.
+
+    Effects are decoded to PCM once, when they load, so playing one is
+    only a copy into the mixer. Each category of effect gets its own
+    channels, which it uses in turn: once all are busy, a new sound
+    replaces the oldest instead of piling up. Each effect can only
+    start again after sound_throttle seconds.
+    """
+
+    # Effect name: (path, volume, category)
+    EFFECTS = {
+        'laser': ('Assets/sound/laser.mp3', 0.5, 'weapons'),
+        'impact': ('Assets/sound/impactSound.mp3', 0.6, 'impacts'),
+    }
+
+    def __init__(self, settings):
+        """Start with nothing loaded; play() is silent until load()."""
+        self.settings = settings
+        self.sounds = {}
+        self.channels = {}
+        self.next_channel = {}
+        self.last_played = {}
+
+    def load(self):
+        """
+        Decode every effect and reserve its category's channels. Call
+        this once the mixer is running.
+        """
+        voices = {'weapons': self.settings.weapon_voices,
+                  'impacts': self.settings.impact_voices}
+        # Reserved channels come first, so the automatic channels that
+        # anything else uses can't take them.
+        total = sum(voices.values())
+        pygame.mixer.set_num_channels(max(total + 2,
+                                          pygame.mixer.get_num_channels()))
+        pygame.mixer.set_reserved(total)
+        channels = {}
+        first = 0
+        for category, count in voices.items():
+            channels[category] = [pygame.mixer.Channel(index)
+                                  for index in range(first, first + count)]
+            first += count
+        
+        sounds = {}
+        for name, (path, volume, category) in self.EFFECTS.items():
+            try:
+                sound = pygame.mixer.Sound(path)
+            except (pygame.error, FileNotFoundError):
+                print("Could not load sound effect " + path)
+                continue
+            sound.set_volume(volume)
+            sounds[name] = sound
+        
+        self.channels = channels
+        self.next_channel = dict.fromkeys(channels, 0)
+        # Handing over the sounds last makes them playable all at once.
+        self.sounds = sounds
+
+    def play(self, name):
+        """Play an effect, unless it isn't loaded or played too recently."""
+        sound = self.sounds.get(name)
+        if sound is None:
+            return False
+        now = perf_counter()
+        if now - self.last_played.get(name, -1.0) < self.settings.sound_throttle:
+            return False
+        
+        category = self.EFFECTS[name][2]
+        channels = self.channels[category]
+        if not channels:
+            return False
+        index = self.next_channel[category]
+        self.next_channel[category] = (index + 1) % len(channels)
+        channels[index].play(sound)
+        self.last_played[name] = now
+        return True
+
+class GlyphAtlas:
+    """
+    A class to draw strings from a strip of pre-rendered characters, so
+    changing a number costs a few blits instead of rendering text.
+    """
+
+    def __init__(self, font, chars, color, background):
+        """
+        Render each character once, side by side, into one surface. With
+        background None the characters are drawn with transparency.
+        """
+        glyphs = [font.render(char, True, color, background) for char in chars]
+        width = sum(glyph.get_width() for glyph in glyphs)
+        self.height = max(glyph.get_height() for glyph in glyphs)
+        
+        if background is None:
+            self.image = pygame.Surface((width, self.height),
+                                        pygame.SRCALPHA).convert_alpha()
+            # Copy the glyphs' alpha as it is instead of blending it.
+            flags = pygame.BLEND_RGBA_MAX
+        else:
+            self.image = pygame.Surface((width, self.height)).convert()
+            self.image.fill(background)
+            flags = 0
+        self.areas = {}
+        x = 0
+        for char, glyph in zip(chars, glyphs):
+            self.image.blit(glyph, (x, 0), special_flags=flags)
+            self.areas[char] = pygame.Rect(x, 0, glyph.get_width(), self.height)
+            x += glyph.get_width()
+
+    def text_rect(self, text):
+        """Return a rect at (0, 0) the size text will be drawn at."""
+        width = sum(self.areas[char].width for char in text)
+        return pygame.Rect(0, 0, width, self.height)
+
+    def layout(self, text, rect):
+        """Return (atlas, position, area) blits that draw text inside rect."""
+        items = []
+        x, y = rect.topleft
+        for char in text:
+            area = self.areas[char]
+            items.append((self.image, (x, y), area))
+            x += area.width
+        return items
+
+class ScriptedInput:
+    """A class to feed scripted events to a headless game, by tick."""
+
+    def __init__(self, script=()):
+        """
+        script is an iterable of (tick, event) pairs. Events for the same
+        tick are handled in the order given.
+        """
+        self.events = {}
+        for tick, event in script:
+            self.add(tick, event)
+
+    def add(self, tick, event):
+        """Schedule event to be handled at the start of tick."""
+        self.events.setdefault(tick, []).append(event)
+
+    def key_press(self, tick, key, hold_ticks=1):
+        """Schedule a KEYDOWN at tick and the matching KEYUP later on."""
+        self.add(tick, pygame.event.Event(pygame.KEYDOWN, key=key))
+        self.add(tick + hold_ticks, pygame.event.Event(pygame.KEYUP, key=key))
+
+    def __call__(self, ai_game, tick):
+        """Return the events to handle at tick."""
+        return self.events.get(tick, ())
+
+class Recorder:
+    """
+    A class to log a session's input, by simulation tick, to a binary file.
+
+    The file starts with a header, then holds fixed-size event records,
+    a keyframe of the whole game state every so often, and an end record
+    with the final tick, score and level.
+    """
+
+    MAGIC = b'AIRP'
+    # Version 1 kept keyframes as compressed JSON; 2 keeps Snapshots.
+    VERSION = 2
+    HEADER = struct.Struct('<4sBH')      # magic, version, sim_rate
+    RECORD = struct.Struct('<IBii')      # tick, kind, then two values
+    
+    # Record kinds. Keys store (key, 0), clicks (x, y), keyframes
+    # (payload length, 0), and the end record (score, level).
+    KEYDOWN, KEYUP, CLICK, KEYFRAME, END = range(5)
+
+    def __init__(self, path, ai_game):
+        """Open path, write the header, and save a first keyframe."""
+        self.file = open(path, 'wb')
+        self.keyframe_ticks = max(1, int(ai_game.settings.keyframe_interval
+                                         * ai_game.settings.sim_rate))
+        self.file.write(self.HEADER.pack(self.MAGIC, self.VERSION,
+                                         ai_game.settings.sim_rate))
+        self.write_keyframe(ai_game)
+
+    def record_event(self, tick, event):
+        """Log a key or click event handled before tick."""
+        if event.type == pygame.KEYDOWN:
+            record = (tick, self.KEYDOWN, event.key, 0)
+        elif event.type == pygame.KEYUP:
+            record = (tick, self.KEYUP, event.key, 0)
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            record = (tick, self.CLICK) + tuple(event.pos)
+        else:
+            return
+        self.file.write(self.RECORD.pack(*record))
+
+    def on_tick(self, ai_game):
+        """Save a keyframe when one is due."""
+        if ai_game.sim_tick % self.keyframe_ticks == 0:
+            self.write_keyframe(ai_game)
+
+    def write_keyframe(self, ai_game):
+        """Save the whole game state as it stands before this tick."""
+        payload = ai_game.snapshot()
+        self.file.write(self.RECORD.pack(ai_game.sim_tick, self.KEYFRAME,
+                                         len(payload), 0))
+        self.file.write(payload)
+        self.file.flush()
+
+    def close(self, ai_game):
+        """Write the end record and close the file."""
+        self.file.write(self.RECORD.pack(ai_game.sim_tick, self.END,
+                                         ai_game.stats.score,
+                                         ai_game.stats.level))
+        self.file.close()
+
+class Replay:
+    """
+    A class to re-simulate a recorded session. Replays are deterministic,
+    so they end on the same score and level as the original session.
+    """
+
+    def __init__(self, path):
+        """Read the events, keyframes and end record from path."""
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        magic, version, self.sim_rate = Recorder.HEADER.unpack_from(data)
+        if magic != Recorder.MAGIC or version not in (1, Recorder.VERSION):
+            raise ValueError(path + " is not an Alien Invasion recording")
+        self.version = version
+        
+        self.input = ScriptedInput()
+        # Keyframe payloads by tick, and their ticks in order.
+        self.keyframes = {}
+        self.end = None
+        
+        offset = Recorder.HEADER.size
+        while offset + Recorder.RECORD.size <= len(data):
+            tick, kind, a, b = Recorder.RECORD.unpack_from(data, offset)
+            offset += Recorder.RECORD.size
+            if kind == Recorder.KEYDOWN:
+                self.input.add(tick, pygame.event.Event(pygame.KEYDOWN, key=a))
+            elif kind == Recorder.KEYUP:
+                self.input.add(tick, pygame.event.Event(pygame.KEYUP, key=a))
+            elif kind == Recorder.CLICK:
+                self.input.add(tick, pygame.event.Event(
+                    pygame.MOUSEBUTTONDOWN, pos=(a, b), button=1))
+            elif kind == Recorder.KEYFRAME:
+                self.keyframes[tick] = data[offset:offset + a]
+                offset += a
+            elif kind == Recorder.END:
+                self.end = {'tick': tick, 'score': a, 'level': b}
+        self.keyframe_ticks = sorted(self.keyframes)
+
+    def seek(self, ai_game, tick, use_keyframes=True):
+        """
+        Bring ai_game to the state it was in before tick, starting from
+        the latest keyframe at or before tick, and simulating the rest.
+        """
+        ai_game.settings.sim_rate = self.sim_rate
+        if use_keyframes:
+            usable = [t for t in self.keyframe_ticks
+                      if ai_game.sim_tick < t <= tick]
+            if usable:
+                payload = self.keyframes[usable[-1]]
+                if self.version == 1:
+                    ai_game._restore_state(json.loads(
+                        zlib.decompress(payload).decode('utf-8')))
+                else:
+                    ai_game.restore(payload)
+        
+        step = 1.0 / self.sim_rate
+        while ai_game.sim_tick < tick:
+            for event in self.input(ai_game, ai_game.sim_tick):
+                ai_game._handle_event(event)
+            ai_game._update_simulation(step)
+
+    def play(self, ai_game, use_keyframes=False):
+        """
+        Re-simulate the whole session in ai_game, as fast as possible.
+        Returns the final state and whether it matches the recording.
+        """
+        end_tick = self.end['tick'] if self.end else max(
+            list(self.input.events) + self.keyframe_ticks + [0])
+        self.seek(ai_game, end_tick, use_keyframes)
+        result = {
+            'tick': ai_game.sim_tick,
+            'score': ai_game.stats.score,
+            'level': ai_game.stats.level,
+        }
+        result['matches'] = self.end is not None and all(
+            result[name] == self.end[name] for name in ('tick', 'score', 'level'))
+        return result
+
+class Snapshot:
+    """
+    A class to pack a game state from AlienInvasion._capture_state() into
+    compact bytes, and back.
+
+    Only plain numbers are stored, never sprites or surfaces, so a
+    snapshot can be restored into any game with the same settings: to
+    resume a suspended session, or to clone a game for branching runs.
+    """
+
+    MAGIC = b'AISS'
+    VERSION = 1
+    HEADER = struct.Struct('<4sB')
+    # sim_tick, stats (state, state_timer, ships_left, score, level,
+    # high_score), dynamic settings (ship, bullet and alien speeds,
+    # fleet_direction, alien_points), the ship (rect x, y, prev_y and its
+    # two movement flags), then the bullet and alien counts.
+    FIXED = struct.Struct('<IBdiqiqdddbqidd??II')
+    BULLET = struct.Struct('<iiddb')     # rect x, rect y, x, prev_x, direction
+    ALIEN = struct.Struct('<ddd')        # x, y, prev_y
+    STATES = ('attract', 'playing', 'respawning', 'game_over')
+
+    @classmethod
+    def pack(cls, state):
+        """Return the bytes for a state dict."""
+        bullets = state['bullets']
+        aliens = state['aliens']
+        body = bytearray(cls.FIXED.pack(
+            state['sim_tick'], cls.STATES.index(state['stats'][0]),
+            *state['stats'][1:], *state['settings'], *state['ship'],
+            len(bullets), len(aliens)))
+        for bullet in bullets:
+            body += cls.BULLET.pack(*bullet)
+        # Aliens go in as one run of doubles; a fleet compresses well.
+        body += struct.pack('<{}d'.format(3 * len(aliens)),
+                            *[value for alien in aliens for value in alien])
+        return cls.HEADER.pack(cls.MAGIC, cls.VERSION) + zlib.compress(body, 1)
+
+    @classmethod
+    def unpack(cls, data):
+        """Return the state dict packed into data."""
+        magic, version = cls.HEADER.unpack_from(data)
+        if magic != cls.MAGIC or version != cls.VERSION:
+            raise ValueError("not an Alien Invasion snapshot")
+        body = zlib.decompress(data[cls.HEADER.size:])
+        
+        fixed = cls.FIXED.unpack_from(body)
+        bullet_count, alien_count = fixed[-2:]
+        offset = cls.FIXED.size
+        bullets = [list(bullet) for bullet in cls.BULLET.iter_unpack(
+            body[offset:offset + bullet_count * cls.BULLET.size])]
+        offset += bullet_count * cls.BULLET.size
+        aliens = [list(alien) for alien in cls.ALIEN.iter_unpack(
+            body[offset:offset + alien_count * cls.ALIEN.size])]
+        
+        return {
+            'sim_tick': fixed[0],
+            'stats': [cls.STATES[fixed[1]]] + list(fixed[2:7]),
+            'settings': list(fixed[7:12]),
+            'ship': list(fixed[12:17]),
+            'bullets': bullets,
+            'aliens': aliens,
+        }
+
 class Settings:
-    """A class to store all game settings."""
+    """
+    A class to store all game settings.
+
+    Any setting can be overridden from a JSON or TOML profile, a mapping
+    of setting names to values (tables only group settings; their names
+    are ignored). Values are checked against the type of each default.
+    """
+    
+    # Settings a running game can't pick up; a live reload skips them.
+    RESTART_ONLY = frozenset((
+        'screen_width', 'screen_height', 'bg_color', 'background_image',
+        'star_layers', 'star_count', 'vsync', 'renderer',
+        'sim_rate', 'fleet_backend', 'collision_cell_size',
+        'audio_frequency', 'audio_buffer', 'weapon_voices', 'impact_voices',
+        'keyframe_interval',
+        'scores_path', 'leaderboard_size', 'profile_window', 'metrics_path',
+    ))
+    # Settings that only take one of a few strings.
+    CHOICES = {
+        'renderer': ('full', 'dirty'),
+        'fleet_backend': ('sprites', 'numpy'),
+        'broadphase': ('grid', 'none'),
+        'fleet_breach_rule': ('none', 'ship_hit'),
+        'collision_shape': ('rect', 'mask'),
+    }
+    # Numbers that must be above zero; all others must not be negative.
+    POSITIVE = frozenset((
+        'screen_width', 'screen_height', 'sim_rate', 'max_frame_time',
+        'sim_speed', 'ship_speed', 'ship_limit', 'bullet_speed',
+        'alien_speed', 'fleet_size', 'collision_cell_size', 'speedup_scale',
+        'score_scale', 'audio_frequency', 'audio_buffer',
+        'keyframe_interval', 'leaderboard_size', 'profile_window',
+        'swarm_waves', 'swarm_wave_time', 'parallax_factor',
+    ))
+    # Paths that may be left out (null) to turn the feature off.
+    OPTIONAL = frozenset(('scores_path', 'metrics_path', 'snapshot_path',
+                          'background_image'))
     
-    def __init__(self):
-        """Initialize the game's settings."""
+    def __init__(self, profile=None):
+        """
+        Initialize the game's settings, then apply the profile at path
+        profile if one is given.
+        """
         # Screen settings
         self.screen_width = 1200
         self.screen_height = 800
         self.bg_color = (0, 0, 0)
+        # Background art (None for a plain bg_color fill) scrolling at
+        # background_speed pixels per second, under star_layers layers of
+        # star_count stars, each parallax_factor times faster than the
+        # layer behind it. The dirty renderer shows them without scrolling.
+        self.background_image = 'Starbasesnow.png'
+        self.background_speed = 8.0
+        self.star_layers = 2
+        self.star_count = 120
+        self.parallax_factor = 2.5
+        
+        # Frame timing settings. The simulation always steps at sim_rate
+        # ticks per second; rendering is capped at fps_cap frames per
+        # second (0 means uncapped), or synced to the display with vsync.
+        self.sim_rate = 120
+        self.fps_cap = 60
+        self.vsync = False
+        # Longest frame the simulation will try to catch up on, in seconds.
+        self.max_frame_time = 0.25
+        # Simulation seconds per real second; 2.0 plays at double speed.
+        self.sim_speed = 1.0
+        
+        # Pauses, in simulation seconds, after Play and after a ship is hit
+        self.start_pause = 0.5
+        self.respawn_pause = 2.0
+        # 'full' redraws and flips the whole screen every frame; 'dirty'
+        # only presents changed rects, up to dirty_rect_limit of them.
+        self.renderer = 'full'
+        self.dirty_rect_limit = 200
+        
+        # Starting values of the settings that speed up each level (speeds
+        # are in pixels per second). initialize_dynamic_settings() copies
+        # them into ship_speed, bullet_speed, alien_speed and alien_points.
+        self.start_values = {
+            'ship_speed': 300.0,
+            'bullet_speed': 900.0,
+            'alien_speed': 150.0,
+            'alien_points': 50,
+        }
         
         # Ship settings
-        self.ship_speed = 1.0
         self.ship_limit = 3
         
         # Bullet settings
-        self.bullet_speed = 3.0
         self.bullet_width = 20
         self.bullet_height = 50
         self.bullet_color = (255, 0, 0)
         self.bullets_allowed = 3
         
         # Alien settings
-        self.alien_speed = 0.4
         self.fleet_drop_speed = 5
+        # Number of aliens in each new fleet
+        self.fleet_size = 30
+        # Fleet formation. 0 means work it out: the number of columns from
+        # the screen width (or from fleet_rows, if set), and spacing of
+        # twice an alien's size, squeezed if the fleet won't fit.
+        self.fleet_columns = 0
+        self.fleet_rows = 0
+        self.fleet_spacing_x = 0
+        self.fleet_spacing_y = 0
+        # How the fleet is stored: 'sprites' (a Group of Alien sprites) or
+        # 'numpy' (a NumpyFleet, for very large fleets)
+        self.fleet_backend = 'sprites'
         # fleet_direction of 1 represents down; -1 represents up
         self.fleet_direction = 1
+        # What happens when the fleet reaches the ship's side of the
+        # screen: 'none' lets it carry on; 'ship_hit' costs a ship.
+        self.fleet_breach_rule = 'none'
+        
+        # Collision settings. 'grid' buckets sprite-fleet aliens into a
+        # spatial hash of collision_cell_size cells; 'none' tests every pair.
+        self.broadphase = 'grid'
+        self.collision_cell_size = 128
+        # 'mask' counts a hit only where the sprites' opaque pixels touch,
+        # after their rects overlap; 'rect' counts any rect overlap.
+        self.collision_shape = 'mask'
         
         # How quickly the game speeds up
         self.speedup_scale = 1.1
@@ -75,19 +786,191 @@ class Settings:
         # How quickly the alien point values increase
         self.score_scale = 1.5
         
+        # Audio settings; a smaller buffer means less delay before a sound
+        self.audio_frequency = 44100
+        self.audio_buffer = 512
+        # Mixer channels kept for each kind of effect, and the shortest
+        # time in seconds before the same effect can play again
+        self.weapon_voices = 3
+        self.impact_voices = 4
+        self.sound_throttle = 0.03
+        
+        # Swarm mode (a stress test): swarm_waves fleets, each replaced
+        # after swarm_wave_time seconds if it hasn't been shot down.
+        self.swarm_waves = 3
+        self.swarm_wave_time = 20.0
+        
+        # Seconds of simulation between keyframes in input recordings
+        self.keyframe_interval = 60.0
+        # Where F5 suspends the session to, for --resume to pick up
+        self.snapshot_path = 'Assets/file/suspended.snap'
+        
+        # Where the top leaderboard_size scores are kept between sessions
+        self.scores_path = 'Assets/file/scores.json'
+        self.leaderboard_size = 10
+        
+        # Frame profiler (F3 shows it). Numbers are averaged over the last
+        # profile_window frames; if metrics_path is set, they are appended
+        # to it every metrics_interval seconds (CSV for a .csv path,
+        # otherwise one JSON object per line).
+        self.profile_window = 120
+        self.metrics_path = None
+        self.metrics_interval = 1.0
+        
+        # The profile these settings came from, watched for changes.
+        self.profile_path = None
+        if profile is not None:
+            self.load_profile(profile)
+        
         self.initialize_dynamic_settings()
     
+    @staticmethod
+    @lru_cache(maxsize=16)
+    def _parse_profile(path, mtime_ns, size):
+        """
+        Read a profile into a flat dict. The file's modification time and
+        size are part of the cache key, so a file is parsed once per edit.
+        """
+        with open(path, 'rb') as f:
+            data = f.read()
+        
+        if path.endswith('.toml') and tomllib is None:
+            raise ValueError(path + ": TOML profiles need Python 3.11")
+        try:
+            if path.endswith('.toml'):
+                values = tomllib.loads(data.decode('utf-8'))
+            else:
+                values = json.loads(data)
+        except ValueError as error:
+            raise ValueError(path + ": " + str(error))
+        if not isinstance(values, dict):
+            raise ValueError(path + ": a profile must be a mapping")
+        
+        flat = {}
+        for name, value in values.items():
+            if isinstance(value, dict):
+                flat.update(value)
+            else:
+                flat[name] = value
+        return flat
+    
+    def read_profile(self, path):
+        """Return the unchecked values in the profile at path."""
+        stat = os.stat(path)
+        return dict(Settings._parse_profile(os.path.abspath(path),
+                                            stat.st_mtime_ns, stat.st_size))
+    
+    def check(self, values, source="settings"):
+        """
+        Return a dict of setting names to values with each value checked
+        and converted, or raise ValueError naming every problem.
+        """
+        checked = {}
+        problems = []
+        for name, value in values.items():
+            try:
+                checked[name] = self._check(name, value)
+            except ValueError as error:
+                problems.append(str(error))
+        if problems:
+            raise ValueError(source + ": " + "; ".join(problems))
+        return checked
+    
+    def _check(self, name, value):
+        """Return value converted to the type of setting name."""
+        if name in self.start_values:
+            default = self.start_values[name]
+        elif name in vars(self) and name not in ('start_values',
+                                                  'profile_path',
+                                                  'fleet_direction'):
+            default = getattr(self, name)
+        else:
+            raise ValueError("unknown setting " + name)
+        
+        if value is None and name in self.OPTIONAL:
+            return None
+        if isinstance(default, bool):
+            if not isinstance(value, bool):
+                raise ValueError(name + " must be true or false")
+        elif isinstance(default, (int, float)):
+            kinds = int if isinstance(default, int) else (int, float)
+            if isinstance(value, bool) or not isinstance(value, kinds):
+                kind = "a whole number" if kinds is int else "a number"
+                raise ValueError(name + " must be " + kind)
+            if name in self.POSITIVE and value <= 0:
+                raise ValueError(name + " must be above zero")
+            if value < 0:
+                raise ValueError(name + " must not be negative")
+            value = type(default)(value)
+        elif isinstance(default, tuple):
+            if (not isinstance(value, (list, tuple)) or len(value) != 3
+                    or not all(isinstance(part, int) and 0 <= part <= 255
+                               for part in value)):
+                raise ValueError(name + " must be three numbers from 0 to 255")
+            value = tuple(value)
+        elif isinstance(default, str) or name in self.OPTIONAL:
+            if not isinstance(value, str):
+                raise ValueError(name + " must be a string")
+            if name in self.CHOICES and value not in self.CHOICES[name]:
+                raise ValueError(name + " must be one of "
+                                 + ", ".join(self.CHOICES[name]))
+        return value
+    
+    def load_profile(self, path, live=False):
+        """
+        Apply the profile at path, as apply() does. All values are checked
+        first, so a bad profile raises ValueError and changes nothing.
+        """
+        values = self.read_profile(path)
+        self.profile_path = path
+        return self.apply(values, live, path)
+    
+    def apply(self, values, live=False, source="settings"):
+        """
+        Check and apply a dict of setting names to values.
+
+        A live apply is for a game in progress: settings in RESTART_ONLY
+        are skipped, and the current speeds and points keep their level's
+        scaling on top of the new starting values. Returns the names that
+        changed and the names skipped.
+        """
+        values = self.check(values, source)
+        
+        changed = []
+        skipped = []
+        for name, value in values.items():
+            if name in self.start_values:
+                old = self.start_values[name]
+                if value == old:
+                    continue
+                self.start_values[name] = value
+                if live and old:
+                    # Keep whatever speed-ups this level has earned.
+                    scaled = getattr(self, name) * value / old
+                    setattr(self, name, type(value)(scaled))
+                elif live:
+                    setattr(self, name, value)
+            elif value == getattr(self, name):
+                continue
+            elif live and name in self.RESTART_ONLY:
+                skipped.append(name)
+                continue
+            else:
+                setattr(self, name, value)
+            changed.append(name)
+        return changed, skipped
+    
     def initialize_dynamic_settings(self):
         """Initialize settings that change throughout the game."""
-        self.ship_speed = 1.0
-        self.bullet_speed = 3.0
-        self.alien_speed = 0.5
+        self.ship_speed = self.start_values['ship_speed']
+        self.bullet_speed = self.start_values['bullet_speed']
+        self.alien_speed = self.start_values['alien_speed']
         
         # fleet_direction of 1 represents down; -1 represents up
         self.fleet_direction = 1
         
         # Scoring
-        self.alien_points = 50
+        self.alien_points = self.start_values['alien_points']
     
     def increase_speed(self):
         """Increase speed settings and alien point values."""
@@ -97,6 +980,58 @@ class Settings:
         
         self.alien_points = int(self.alien_points * self.score_scale)
 
+class SettingsWatcher:
+    """
+    A class to reload the settings profile while the game runs.
+
+    poll() is called between frames and looks at the file's modification
+    time at most every interval seconds, so it costs next to nothing.
+    """
+
+    def __init__(self, ai_game, path, interval=0.5):
+        """Remember the profile as it is now."""
+        self.ai_game = ai_game
+        self.settings = ai_game.settings
+        self.path = path
+        self.interval = interval
+        self.stamp = self._stamp()
+        self.next_check = perf_counter() + interval
+
+    def _stamp(self):
+        """Return what identifies this version of the file."""
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+    def poll(self):
+        """Apply the profile if it changed. Returns True if it was."""
+        now = perf_counter()
+        if now < self.next_check:
+            return False
+        self.next_check = now + self.interval
+        
+        stamp = self._stamp()
+        if stamp is None or stamp == self.stamp:
+            return False
+        self.stamp = stamp
+        
+        try:
+            changed, skipped = self.settings.load_profile(self.path, live=True)
+        except (OSError, ValueError) as error:
+            # Keep playing with the old settings until the file is fixed.
+            print("Could not reload settings: " + str(error))
+            return False
+        
+        for name in skipped:
+            print(name + " will change after a restart")
+        if changed:
+            print("Reloaded " + ", ".join(changed))
+            # The broadphase may have been switched on.
+            self.ai_game.alien_grid.stale = True
+        return bool(changed)
+
 class Ship(Sprite):
     """A class to manage the ship."""
     
@@ -107,45 +1042,50 @@ class Ship(Sprite):
         self.settings = ai_game.settings
         self.screen_rect = ai_game.screen.get_rect()
         
-        # Load the ship image and scale it smaller
-        original_image = pygame.image.load('2ndchip.png')
-        
-        # For example, scale to 50% of original size
-        scale_factor = 0.15
-    
-        new_width = int(original_image.get_width() * scale_factor)
-        new_height = int(original_image.get_height() * scale_factor)
-        
-        self.image = pygame.transform.smoothscale(original_image, (new_width, new_height))
-        self.rect = self.image.get_rect()
-        
-        # Rest of your code unchanged...
+        # Get the shared ship image, scaled to 15% of original size.
+        # The right-hand ship is rotated to face the center.
         self.position = position
+        rotation = 0 if position == 'left' else 90
+        self.image = ai_game.assets.image('2ndchip.png', 0.15, rotation)
+        self.mask = ai_game.assets.mask('2ndchip.png', 0.15, rotation)
+        self.rect = self.image.get_rect()
+
         if position == 'left':
             self.rect.midleft = self.screen_rect.midleft
         else:
             self.rect.midright = self.screen_rect.midright
-            self.image = pygame.transform.rotate(self.image, 90)
         
         self.y = float(self.rect.y)
+        self.prev_y = self.y
         self.moving_up = False
         self.moving_down = False
 
     
-    def update(self):
+    def update(self, dt):
         """Update the ship's position based on movement flags."""
+        self.prev_y = self.y
+        
         # Update the ship's y value, not the x.
         if self.moving_up and self.rect.top > 0:
-            self.y -= self.settings.ship_speed
+            self.y -= self.settings.ship_speed * dt
         if self.moving_down and self.rect.bottom < self.screen_rect.bottom:
-            self.y += self.settings.ship_speed
+            self.y += self.settings.ship_speed * dt
             
         # Update rect object from self.y
         self.rect.y = self.y
     
-    def blitme(self):
+    def draw_rect(self, alpha=1.0):
+        """
+        Return the rect to draw the ship at, blended alpha of the way
+        from its previous simulation tick.
+        """
+        draw_rect = self.rect.copy()
+        draw_rect.y = self.prev_y + (self.y - self.prev_y) * alpha
+        return draw_rect
+    
+    def blitme(self, alpha=1.0):
         """Draw the ship at its current location."""
-        self.screen.blit(self.image, self.rect)
+        self.screen.blit(self.image, self.draw_rect(alpha))
     
     def center_ship(self):
         """Center the ship on the left or right side of the screen."""
@@ -154,6 +1094,7 @@ class Ship(Sprite):
         else:
             self.rect.midright = self.screen_rect.midright
         self.y = float(self.rect.y)
+        self.prev_y = self.y
 
 class Bullet(Sprite):
     """A class to manage bullets fired from the ship."""
@@ -163,41 +1104,94 @@ class Bullet(Sprite):
         super().__init__()
         self.screen = ai_game.screen
         self.settings = ai_game.settings
-        self.ship = ai_game.ship
         
-        # Load the laser image
-        original_image = pygame.image.load('2ndlazer.png')
-        scale_factor = 0.1
-        new_width = int(original_image.get_width() * scale_factor)
-        new_height = int(original_image.get_height() * scale_factor)
-        self.image = pygame.transform.smoothscale(original_image, (new_width, new_height))
+        # Get the shared laser image.
+        self.image = ai_game.assets.image('2ndlazer.png', 0.1)
+        self.mask = ai_game.assets.mask('2ndlazer.png', 0.1)
         
         # Create a bullet rect at (0, 0) and then set correct position.
         self.rect = self.image.get_rect()
-        
-        # Set bullet position based on ship position
-        if self.ship.position == 'left':
-            self.rect.midleft = self.ship.rect.midright
+        self.fire_from(ai_game.ship)
+    
+    def fire_from(self, ship):
+        """Move the bullet to the front of ship, ready to fly."""
+        # Set bullet position based on ship position; 1 flies right.
+        if ship.position == 'left':
+            self.rect.midleft = ship.rect.midright
+            self.direction = 1
         else:  # right position
-            self.rect.midright = self.ship.rect.midleft
+            self.rect.midright = ship.rect.midleft
+            self.direction = -1
         
         # Store the bullet's position as a decimal value.
         self.x = float(self.rect.x)
+        self.prev_x = self.x
     
-    def update(self):
+    def update(self, dt):
         """Move the bullet across the screen."""
+        self.prev_x = self.x
+        
         # Update the decimal position of the bullet.
-        if self.ship.position == 'left':
-            self.x += self.settings.bullet_speed
-        else:  # right position
-            self.x -= self.settings.bullet_speed
+        self.x += self.settings.bullet_speed * self.direction * dt
             
         # Update the rect position.
         self.rect.x = self.x
     
-    def draw_bullet(self):
+    def draw_rect(self, alpha=1.0):
+        """Return the rect to draw the bullet at, blended from its last tick."""
+        draw_rect = self.rect.copy()
+        draw_rect.x = self.prev_x + (self.x - self.prev_x) * alpha
+        return draw_rect
+    
+    def draw_bullet(self, alpha=1.0):
         """Draw the bullet to the screen."""
-        self.screen.blit(self.image, self.rect)
+        self.screen.blit(self.image, self.draw_rect(alpha))
+
+class BulletPool(Group):
+    """
+    A Group of bullets whose Bullet objects are made ahead of time and
+    reused. A bullet that leaves the group, whether culled, killed in a
+    collision or emptied, goes back on the free list for the next shot.
+    """
+
+    def __init__(self, ai_game, capacity):
+        """Make capacity bullets up front."""
+        super().__init__()
+        self.ai_game = ai_game
+        self.screen_width = ai_game.settings.screen_width
+        self.free = [Bullet(ai_game) for _ in range(capacity)]
+        # Reused every tick to hold off-screen bullets.
+        self._culled = []
+
+    def fire(self, ship):
+        """Take a bullet off the free list, aim it from ship, and add it."""
+        if self.free:
+            bullet = self.free.pop()
+        else:
+            # bullets_allowed was raised past the pool; grow it once.
+            bullet = Bullet(self.ai_game)
+        bullet.fire_from(ship)
+        self.add_internal(bullet)
+        bullet.add_internal(self)
+        return bullet
+
+    def remove_internal(self, sprite):
+        """Remove a bullet from the group and free its slot."""
+        super().remove_internal(sprite)
+        self.free.append(sprite)
+
+    def update(self, dt):
+        """Move every bullet, then free the ones that left the screen."""
+        culled = self._culled
+        # Walk the dict itself; Group.update would copy it to a list.
+        for bullet in self.spritedict:
+            bullet.update(dt)
+            if bullet.rect.right <= 0 or bullet.rect.left >= self.screen_width:
+                culled.append(bullet)
+        if culled:
+            for bullet in culled:
+                bullet.kill()
+            culled.clear()
 
 class Alien(Sprite):
     """A class to represent a single alien in the fleet."""
@@ -207,28 +1201,491 @@ class Alien(Sprite):
         self.screen = ai_game.screen
         self.settings = ai_game.settings
 
-        original_image = pygame.image.load('2ndALIENship.png')
-        scale_factor = 0.03
-        new_width = int(original_image.get_width() * scale_factor)
-        new_height = int(original_image.get_height() * scale_factor)
-        self.image = pygame.transform.smoothscale(original_image, (new_width, new_height))
+        # Get the shared alien image and its collision mask.
+        self.image = ai_game.assets.image('2ndALIENship.png', 0.03)
+        self.mask = ai_game.assets.mask('2ndALIENship.png', 0.03)
 
         self.rect = self.image.get_rect()
         self.rect.x = self.rect.width
         self.rect.y = self.rect.height
         self.y = float(self.rect.y)
+        self.prev_y = self.y
 
     def check_edges(self):
         """Return True if alien is at edge of screen."""
-        screen_rect = self.screen.get_rect()
-        if self.rect.bottom >= screen_rect.bottom or self.rect.top <= 0:
-            return True
+        return (self.rect.bottom >= self.settings.screen_height
+                or self.rect.top <= 0)
     
-    def update(self):
+    def update(self, dt):
         """Move the alien up or down."""
+        self.prev_y = self.y
         self.y += (self.settings.alien_speed *
-                   self.settings.fleet_direction)
+                   self.settings.fleet_direction * dt)
         self.rect.y = self.y
+    
+    def draw_rect(self, alpha=1.0):
+        """Return the rect to draw at, blended from the alien's last tick."""
+        draw_rect = self.rect.copy()
+        draw_rect.y = self.prev_y + (self.y - self.prev_y) * alpha
+        return draw_rect
+
+class AlienFleet(Group):
+    """
+    A Group of aliens that keeps the bounding box of the whole fleet.
+
+    Every alien moves by the same amount each tick, so the box moves with
+    them in constant time, and edge checks never walk the fleet. The box
+    is only measured again after aliens are added or an alien on its edge
+    is removed.
+    """
+
+    def __init__(self, ai_game):
+        """Start with an empty fleet."""
+        super().__init__()
+        self.settings = ai_game.settings
+        # y of the highest and lowest aliens, the tallest alien's height,
+        # and the fleet's left and right sides.
+        self.top_y = self.bottom_y = 0.0
+        self.height = 0
+        self.left = self.right = 0
+        self.stale = False
+
+    @staticmethod
+    def rect_coord(value):
+        """Round value to an int the way assigning it to a Rect does."""
+        return int(value + copysign(0.5, value))
+
+    def add_internal(self, sprite, layer=None):
+        """Add an alien; the box is measured again when next needed."""
+        super().add_internal(sprite, layer)
+        # Fleets are built all at once, so one measurement afterwards is
+        # cheaper than growing the box alien by alien.
+        self.stale = True
+
+    def remove_internal(self, sprite):
+        """Remove an alien; if it was on the edge, measure again later."""
+        super().remove_internal(sprite)
+        rect = sprite.rect
+        if (sprite.y == self.top_y or sprite.y == self.bottom_y
+                or rect.left == self.left or rect.right == self.right):
+            self.stale = True
+
+    def _measure(self):
+        """Find the box by looking at every alien."""
+        aliens = self.spritedict
+        self.top_y = min(alien.y for alien in aliens)
+        self.bottom_y = max(alien.y for alien in aliens)
+        self.height = max(alien.rect.height for alien in aliens)
+        self.left = min(alien.rect.left for alien in aliens)
+        self.right = max(alien.rect.right for alien in aliens)
+        self.stale = False
+
+    def bounds(self):
+        """Return the Rect around every alien, or None with no aliens."""
+        if not self.spritedict:
+            return None
+        if self.stale:
+            self._measure()
+        top = self.rect_coord(self.top_y)
+        bottom = self.rect_coord(self.bottom_y) + self.height
+        return pygame.Rect(self.left, top, self.right - self.left,
+                           bottom - top)
+
+    def check_edges(self):
+        """Return True if any alien is at the top or bottom edge."""
+        bounds = self.bounds()
+        return bounds is not None and (
+            bounds.bottom >= self.settings.screen_height or bounds.top <= 0)
+
+    def update(self, dt):
+        """Move every alien, and the box with them."""
+        # Walk the dict itself; Group.update would copy it to a list.
+        for alien in self.spritedict:
+            alien.update(dt)
+        distance = (self.settings.alien_speed * self.settings.fleet_direction
+                    * dt)
+        self.top_y += distance
+        self.bottom_y += distance
+
+    def drop(self, distance):
+        """Move the whole fleet sideways by distance pixels."""
+        for alien in self.spritedict:
+            alien.rect.x += distance
+        self.left += distance
+        self.right += distance
+
+
+class SpatialHash:
+    """
+    A class to bucket sprites into a uniform grid of square cells, so a
+    rect only has to be tested against the sprites in the cells it covers.
+
+    The fleet moves as one, so instead of re-bucketing every alien each
+    tick the grid keeps the distance the fleet has moved since it was
+    built, and shifts each query back by that much.
+    """
+
+    def __init__(self, cell_size):
+        """Start with an empty grid that needs building."""
+        self.cell_size = cell_size
+        self.cells = {}
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self.stale = True
+
+    def shift(self, dx, dy):
+        """Record that every bucketed sprite has moved by dx, dy."""
+        self.offset_x += dx
+        self.offset_y += dy
+
+    def _cell_range(self, rect):
+        """Return the ranges of cell columns and rows that rect covers."""
+        size = self.cell_size
+        columns = range(rect.left // size, (rect.right - 1) // size + 1)
+        rows = range(rect.top // size, (rect.bottom - 1) // size + 1)
+        return columns, rows
+
+    def rebuild(self, group):
+        """Bucket every sprite in group by its current rect."""
+        cells = {}
+        for sprite in group.sprites():
+            columns, rows = self._cell_range(sprite.rect)
+            for column in columns:
+                for row in rows:
+                    cell = cells.get((column, row))
+                    if cell is None:
+                        cells[(column, row)] = [sprite]
+                    else:
+                        cell.append(sprite)
+        self.cells = cells
+        self.offset_x = 0.0
+        self.offset_y = 0.0
+        self.stale = False
+
+    def collide(self, rect, first_only=False, mask=None):
+        """
+        Return the sprites that overlap rect and are still in a group, in
+        the order they were bucketed. Stops at the first one if first_only.
+        With a mask for rect, sprites must also overlap it pixel for pixel.
+        """
+        found = []
+        seen = set()
+        # Look where rect would have been when the grid was built, with a
+        # pixel to spare for the sprites' own rounding.
+        query = pygame.Rect(rect.left - round(self.offset_x) - 1,
+                            rect.top - round(self.offset_y) - 1,
+                            rect.width + 2, rect.height + 2)
+        columns, rows = self._cell_range(query)
+        for column in columns:
+            for row in rows:
+                for sprite in self.cells.get((column, row), ()):
+                    if sprite in seen:
+                        continue
+                    seen.add(sprite)
+                    if (sprite.alive() and sprite.rect.colliderect(rect)
+                            and (mask is None or mask.overlap(
+                                sprite.mask, (sprite.rect.x - rect.x,
+                                              sprite.rect.y - rect.y)))):
+                        found.append(sprite)
+                        if first_only:
+                            return found
+        return found
+
+class NumpyFleet:
+    """
+    A class to manage a whole fleet of aliens as NumPy arrays.
+
+    Positions, sizes and alive flags live in parallel arrays, so moving
+    the fleet, checking its edges and dropping it are each one vectorized
+    operation however many aliens there are. It stands in for the Group
+    of Alien sprites when Settings.fleet_backend is 'numpy'.
+    """
+
+    def __init__(self, ai_game):
+        """Start with an empty fleet that uses the shared alien image."""
+        self.screen = ai_game.screen
+        self.settings = ai_game.settings
+        self.image = ai_game.assets.image('2ndALIENship.png', 0.03)
+        self.mask = ai_game.assets.mask('2ndALIENship.png', 0.03)
+        self.empty()
+
+    def empty(self):
+        """Remove every alien."""
+        self.set_positions(np.empty(0), np.empty(0))
+
+    def set_positions(self, xs, ys, prev_ys=None):
+        """
+        Replace the fleet with aliens whose top-left corners are xs, ys,
+        and that were at prev_ys on the last tick (ys if not given).
+        """
+        width, height = self.image.get_size()
+        # Keep the aliens sorted by x. The whole fleet moves together, so
+        # the order never changes and collisions can sweep along x.
+        order = np.argsort(np.asarray(xs), kind='stable')
+        self.x = np.asarray(xs, dtype=float)[order]
+        self.y = np.asarray(ys, dtype=float)[order]
+        self.max_width = width
+        if prev_ys is None:
+            self.prev_y = self.y.copy()
+        else:
+            self.prev_y = np.asarray(prev_ys, dtype=float)[order]
+        self.width = np.full(len(self.x), width)
+        self.height = np.full(len(self.x), height)
+        self.alive = np.ones(len(self.x), dtype=bool)
+        self.count = len(self.x)
+        # The fleet's bounding box, as AlienFleet keeps it. It is
+        # measured the first time it is needed.
+        self.top_y = self.bottom_y = 0.0
+        self.left = self.right = 0.0
+        self.stale = True
+
+    def __len__(self):
+        return self.count
+
+    def __bool__(self):
+        return self.count > 0
+
+    def _compact(self):
+        """Drop dead aliens from the arrays once most of them are gone."""
+        keep = self.alive
+        self.x = self.x[keep]
+        self.y = self.y[keep]
+        self.prev_y = self.prev_y[keep]
+        self.width = self.width[keep]
+        self.height = self.height[keep]
+        self.alive = self.alive[keep]
+
+    def _rect_y(self):
+        """Return the integer rect tops, rounded the way pygame.Rect does."""
+        return np.trunc(self.y + np.copysign(0.5, self.y))
+
+    def update(self, dt):
+        """Move every alien up or down, and the bounding box with them."""
+        distance = (self.settings.alien_speed * self.settings.fleet_direction
+                    * dt)
+        self.prev_y[:] = self.y
+        self.y += distance
+        self.top_y += distance
+        self.bottom_y += distance
+
+    def _measure(self):
+        """Find the bounding box of the live aliens."""
+        alive = self.alive
+        self.top_y = float(self.y[alive].min())
+        self.bottom_y = float(self.y[alive].max())
+        self.left = float(self.x[alive].min())
+        self.right = float((self.x + self.width)[alive].max())
+        self.stale = False
+
+    def bounds(self):
+        """Return the Rect around every live alien, or None if none are."""
+        if not self.count:
+            return None
+        if self.stale:
+            self._measure()
+        # Every alien shares one image, so they are all the same height.
+        top = AlienFleet.rect_coord(self.top_y)
+        bottom = AlienFleet.rect_coord(self.bottom_y) + self.image.get_height()
+        left = AlienFleet.rect_coord(self.left)
+        return pygame.Rect(left, top, AlienFleet.rect_coord(self.right) - left,
+                           bottom - top)
+
+    def check_edges(self):
+        """Return True if any live alien is at the top or bottom edge."""
+        bounds = self.bounds()
+        return bounds is not None and (
+            bounds.bottom >= self.settings.screen_height or bounds.top <= 0)
+
+    def drop(self, distance):
+        """Move the whole fleet sideways by distance pixels."""
+        self.x += distance
+        self.left += distance
+        self.right += distance
+
+    def _windows(self, lefts, rights):
+        """
+        Return the start and stop indices of the aliens whose x could put
+        them between each left and right. x is sorted, so this is a pair
+        of binary searches.
+        """
+        starts = np.searchsorted(self.x, np.asarray(lefts) - self.max_width,
+                                 'right')
+        stops = np.searchsorted(self.x, rights, 'left')
+        return starts, stops
+
+    def _hits(self, rect, top, start, stop):
+        """
+        Return the indices of live aliens in x window start:stop whose
+        rects overlap rect, given the aliens' rect tops.
+        """
+        window = slice(start, stop)
+        x = self.x[window]
+        top = top[window]
+        mask = (self.alive[window]
+                & (rect.left < x + self.width[window])
+                & (top < rect.bottom) & (rect.top < top + self.height[window]))
+        return start + np.flatnonzero(mask)
+
+    def _touching(self, hit, rect, mask, top):
+        """Return the aliens in hit whose pixels overlap mask at rect."""
+        return np.array([index for index in hit.tolist()
+                         if mask.overlap(self.mask,
+                                         (int(self.x[index]) - rect.left,
+                                          int(top[index]) - rect.top))],
+                        dtype=int)
+
+    def collide_rect(self, rect, mask=None):
+        """
+        Return True if any live alien overlaps rect, and if a mask for
+        rect is given, overlaps it pixel for pixel.
+        """
+        starts, stops = self._windows([rect.left], [rect.right])
+        top = self._rect_y()
+        hit = self._hits(rect, top, starts[0], stops[0])
+        if len(hit) and mask is not None:
+            hit = self._touching(hit, rect, mask, top)
+        return len(hit) > 0
+
+    def collide_group(self, group, precise=False):
+        """
+        Kill the aliens hit by sprites in group, like groupcollide with
+        both kill flags set. Returns a dict mapping each sprite that hit
+        something to the indices of the aliens it killed. If precise,
+        pairs whose rects overlap must also overlap by their masks.
+        """
+        collisions = {}
+        if not self.count:
+            return collisions
+        top = self._rect_y()
+        sprites = group.sprites()
+        starts, stops = self._windows([s.rect.left for s in sprites],
+                                      [s.rect.right for s in sprites])
+        # Only sprites with some aliens in their x window need testing.
+        for index in np.flatnonzero(stops > starts).tolist():
+            sprite = sprites[index]
+            hit = self._hits(sprite.rect, top, starts[index], stops[index])
+            if len(hit) and precise:
+                hit = self._touching(hit, sprite.rect, sprite.mask, top)
+            if len(hit):
+                self.alive[hit] = False
+                self.count -= len(hit)
+                self.stale = True
+                collisions[sprite] = hit.tolist()
+                sprite.kill()
+        if self.count * 2 < len(self.alive):
+            self._compact()
+        return collisions
+
+    def draw(self, screen, alpha=1.0):
+        """Draw every live, on-screen alien with a single batched blit."""
+        screen.blits(self.blit_list(screen, alpha), False)
+
+    def blit_list(self, screen, alpha=1.0):
+        """Return (image, position) pairs for every live, on-screen alien."""
+        draw_y = self.prev_y + (self.y - self.prev_y) * alpha
+        width, height = screen.get_size()
+        visible = (self.alive
+                   & (self.x < width) & (self.x + self.width > 0)
+                   & (draw_y < height) & (draw_y + self.height > 0))
+        positions = np.column_stack((self.x, draw_y))[visible]
+        return [(self.image, position) for position in positions.tolist()]
+
+class Leaderboard:
+    """
+    A class to keep the top scores in a JSON file.
+
+    Scores are loaded once at startup. New scores are written by a
+    background thread, which waits a moment so several can go out in one
+    write, and replaces the file atomically so it is never half-written.
+    """
+
+    def __init__(self, path, size=10, flush_delay=1.0):
+        """Load the stored scores; path None keeps them in memory only."""
+        self.path = path
+        self.size = size
+        self.flush_delay = flush_delay
+        self.entries = self._load()
+        
+        self._cond = threading.Condition()
+        self._dirty = False
+        self._closing = False
+        self._thread = None
+
+    def _load(self):
+        """Return the stored entries, best first, or [] if there are none."""
+        if self.path is None:
+            return []
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)['scores']
+        except (OSError, ValueError, KeyError, TypeError):
+            # A missing, empty or damaged file starts a fresh board.
+            return []
+        entries.sort(key=lambda entry: entry['score'], reverse=True)
+        return entries[:self.size]
+
+    def best(self):
+        """Return the highest stored score, or 0."""
+        return self.entries[0]['score'] if self.entries else 0
+
+    def record(self, score, level):
+        """Add a finished game if it makes the board; never touches disk."""
+        if score <= 0:
+            return
+        with self._cond:
+            if (len(self.entries) >= self.size
+                    and score <= self.entries[-1]['score']):
+                return
+            self.entries.append({'score': score, 'level': level,
+                                 'date': date.today().isoformat()})
+            self.entries.sort(key=lambda entry: entry['score'], reverse=True)
+            del self.entries[self.size:]
+            
+            if self.path is None:
+                return
+            self._dirty = True
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+            self._cond.notify()
+
+    def _run(self):
+        """Write the board whenever it changes, until closed."""
+        while True:
+            with self._cond:
+                while not self._dirty and not self._closing:
+                    self._cond.wait()
+                if not self._closing:
+                    # Let more scores pile up before touching the disk.
+                    self._cond.wait(self.flush_delay)
+                entries = list(self.entries) if self._dirty else None
+                self._dirty = False
+                closing = self._closing
+            
+            if entries is not None:
+                self._write(entries)
+            if closing:
+                return
+
+    def _write(self, entries):
+        """Write entries to a temporary file, then rename it into place."""
+        temp_path = self.path + '.tmp'
+        try:
+            with open(temp_path, 'w') as f:
+                json.dump({'scores': entries}, f, indent=2)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(temp_path, self.path)
+        except OSError:
+            print("Could not save scores to " + self.path)
+
+    def close(self):
+        """Write any pending scores and stop the writer thread."""
+        with self._cond:
+            self._closing = True
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join(timeout=5.0)
 
 class GameStats:
     """Track statistics for Alien Invasion."""
@@ -238,15 +1695,25 @@ class GameStats:
         self.settings = ai_game.settings
         self.reset_stats()
         
-        # Start Alien Invasion in an inactive state.
-        self.game_active = False
+        # The high score carries over between games and sessions.
+        self.high_score = ai_game.leaderboard.best()
+        
+        # Start Alien Invasion in an inactive state. The state is one of
+        # 'attract', 'playing', 'respawning' or 'game_over'.
+        self.state = 'attract'
+        # Simulation seconds left before 'respawning' turns to 'playing'.
+        self.state_timer = 0.0
+    
+    @property
+    def game_active(self):
+        """True while a game is in progress, including respawn pauses."""
+        return self.state in ('playing', 'respawning')
     
     def reset_stats(self):
         """Initialize statistics that can change during the game."""
         self.ships_left = self.settings.ship_limit
         self.score = 0
         self.level = 1
-        self.high_score = 0
 
 class Scoreboard:
     """A class to report scoring information."""
@@ -259,9 +1726,18 @@ class Scoreboard:
         self.settings = ai_game.settings
         self.stats = ai_game.stats
         
-        # Font settings for scoring information.
+        # Font settings for scoring information. Numbers are drawn from
+        # a pre-rendered strip of digits and commas.
         self.text_color = (255, 255, 255)
-        self.font = pygame.font.SysFont(None, 48)
+        self.font = ai_game.fonts.get(32)
+        # Over a plain background the digits can be opaque, which blits
+        # faster; over art they need to be see-through.
+        self.digits = GlyphAtlas(
+            self.font, '0123456789,', self.text_color,
+            self.settings.bg_color if ai_game.background.plain else None)
+        
+        # Every remaining ship is drawn with the same cached icon.
+        self.ship_image = ai_game.assets.image('2ndchip.png', 0.15, 90)
         
         # Prepare the initial score images.
         self.prep_score()
@@ -270,48 +1746,46 @@ class Scoreboard:
         self.prep_ships()
     
     def prep_score(self):
-        """Turn the score into a rendered image."""
+        """Lay out the score from the digit atlas."""
         rounded_score = round(self.stats.score, -1)
         score_str = "{:,}".format(rounded_score)
-        self.score_image = self.font.render(score_str, True,
-                self.text_color, self.settings.bg_color)
         
         # Display the score at the top right of the screen.
-        self.score_rect = self.score_image.get_rect()
+        self.score_rect = self.digits.text_rect(score_str)
         self.score_rect.right = self.screen_rect.right - 20
         self.score_rect.top = 20
+        self.score_items = self.digits.layout(score_str, self.score_rect)
     
     def prep_high_score(self):
-        """Turn the high score into a rendered image."""
+        """Lay out the high score from the digit atlas."""
         high_score = round(self.stats.high_score, -1)
         high_score_str = "{:,}".format(high_score)
-        self.high_score_image = self.font.render(high_score_str, True,
-                self.text_color, self.settings.bg_color)
         
         # Center the high score at the top of the screen.
-        self.high_score_rect = self.high_score_image.get_rect()
+        self.high_score_rect = self.digits.text_rect(high_score_str)
         self.high_score_rect.centerx = self.screen_rect.centerx
         self.high_score_rect.top = self.score_rect.top
+        self.high_score_items = self.digits.layout(high_score_str,
+                                                   self.high_score_rect)
     
     def prep_level(self):
-        """Turn the level into a rendered image."""
+        """Lay out the level from the digit atlas."""
         level_str = str(self.stats.level)
-        self.level_image = self.font.render(level_str, True,
-                self.text_color, self.settings.bg_color)
         
         # Position the level below the score.
-        self.level_rect = self.level_image.get_rect()
+        self.level_rect = self.digits.text_rect(level_str)
         self.level_rect.right = self.score_rect.right
         self.level_rect.top = self.score_rect.bottom + 10
+        self.level_items = self.digits.layout(level_str, self.level_rect)
     
     def prep_ships(self):
         """Show how many ships are left."""
-        self.ships = Group()
+        self.ship_rects = []
         for ship_number in range(self.stats.ships_left):
-            ship = Ship(self.ai_game)
-            ship.rect.x = 10 + ship_number * ship.rect.width
-            ship.rect.y = 10
-            self.ships.add(ship)
+            ship_rect = self.ship_image.get_rect()
+            ship_rect.x = 10 + ship_number * ship_rect.width
+            ship_rect.y = 10
+            self.ship_rects.append(ship_rect)
     
     def check_high_score(self):
         """Check to see if there's a new high score."""
@@ -319,101 +1793,810 @@ class Scoreboard:
             self.stats.high_score = self.stats.score
             self.prep_high_score()
     
+    def hud_items(self):
+        """Return the blits that draw the scores, level, and ships."""
+        items = self.score_items + self.high_score_items + self.level_items
+        items.extend((self.ship_image, rect) for rect in self.ship_rects)
+        return items
+    
     def show_score(self):
         """Draw scores, level, and ships to the screen."""
-        self.screen.blit(self.score_image, self.score_rect)
-        self.screen.blit(self.high_score_image, self.high_score_rect)
-        self.screen.blit(self.level_image, self.level_rect)
-        self.ships.draw(self.screen)
+        self.screen.blits(self.hud_items(), False)
+
+class Background:
+    """
+    A class to draw the scrolling background behind everything else.
+
+    The art and each starfield layer are composited once, the first time
+    they are needed, into display-format strips a screen wider than their
+    repeat, with the start copied onto the end. Scrolling is then a
+    single sub-blit per layer from a moving offset, with no scaling and
+    no stars drawn one at a time. Starfields are colorkeyed and
+    run-length encoded, so their blits only touch the stars.
+    """
+
+    # Scale that makes the art cover the default screen; see SPRITES.
+    ART_SCALE = 0.55
+    # Star size and brightness for the back layer; nearer layers get
+    # bigger and brighter.
+    STAR_COLOR = (110, 110, 140)
+
+    def __init__(self, ai_game):
+        """Remember the settings; the layers are built when first drawn."""
+        self.ai_game = ai_game
+        self.assets = ai_game.assets
+        self.settings = ai_game.settings
+        self.size = ai_game.screen.get_size()
+        # (strip, period, speed factor) for each layer, back to front.
+        self.layers = None
+        self.has_art = False
+        self._static = None
+
+    @property
+    def plain(self):
+        """True if the background is only a bg_color fill."""
+        return (self.settings.background_image is None
+                and not self.settings.star_layers)
+
+    def _build(self):
+        """Composite the art and starfields into their strips."""
+        width, height = self.size
+        self.layers = []
+        factor = 1.0
+        path = self.settings.background_image
+        if path is not None:
+            try:
+                art = self.assets.image(path, self.ART_SCALE)
+            except (pygame.error, FileNotFoundError):
+                print("Could not load background " + path)
+                art = None
+            if art is not None:
+                if art.get_width() < width or art.get_height() < height:
+                    # Scale up once so the art covers the screen.
+                    scale = max(width / art.get_width(),
+                                height / art.get_height())
+                    art = pygame.transform.smoothscale(
+                        art, (int(art.get_width() * scale + 1),
+                              int(art.get_height() * scale + 1)))
+                period = art.get_width()
+                # Show the middle of art taller than the screen.
+                top = (art.get_height() - height) // 2
+                strip = pygame.Surface((period + width, height)).convert()
+                strip.blit(art, (0, 0), (0, top, period, height))
+                strip.blit(art, (period, 0), (0, top, width, height))
+                self.layers.append((strip, period, factor))
+                self.has_art = True
+                factor *= self.settings.parallax_factor
+
+        for layer in range(self.settings.star_layers):
+            self.layers.append((self._starfield(layer), width, factor))
+            factor *= self.settings.parallax_factor
+
+    def _starfield(self, layer):
+        """Return a strip of stars for layer, seeded so it never changes."""
+        width, height = self.size
+        rng = random.Random(layer)
+        strip = pygame.Surface((2 * width, height)).convert()
+        strip.fill((0, 0, 0))
+        brightness = min(1.0, (layer + 1) / self.settings.star_layers + 0.2)
+        color = [min(255, int(part * (1 + brightness))) for part in
+                 self.STAR_COLOR]
+        radius = 1 + layer // 2
+        for _ in range(self.settings.star_count):
+            x = rng.randrange(width)
+            y = rng.randrange(height)
+            for copy_x in (x, x + width):
+                pygame.draw.circle(strip, color, (copy_x, y), radius)
+        strip.set_colorkey((0, 0, 0), pygame.RLEACCEL)
+        return strip
+
+    def static(self):
+        """Return every layer composited at rest, for the dirty renderer."""
+        if self._static is None:
+            self._static = pygame.Surface(self.size).convert()
+            self._static.fill(self.settings.bg_color)
+            if not self.plain:
+                if self.layers is None:
+                    self._build()
+                for strip, _, _ in self.layers:
+                    self._static.blit(strip, (0, 0))
+        return self._static
+
+    def draw(self, screen, seconds):
+        """Draw the background scrolled to seconds of simulation time."""
+        if self.plain:
+            screen.fill(self.settings.bg_color)
+            return
+        if self.layers is None:
+            self._build()
+        if not self.has_art:
+            screen.fill(self.settings.bg_color)
+        width, height = self.size
+        shift = self.settings.background_speed * seconds
+        for strip, period, factor in self.layers:
+            # The ships fly toward the fleet, so the layers stream right.
+            offset = int(-shift * factor) % period
+            screen.blit(strip, (0, 0), (offset, 0, width, height))
+
+class DirtyRenderer:
+    """
+    A class to present only the parts of the screen that changed.
+
+    Like pygame's RenderUpdates, it erases last frame's rects from a
+    background and redraws, but it works from lists of (image, position)
+    so it can draw interpolated sprites and the NumPy fleet. When nothing
+    moved and the HUD is unchanged, a frame costs no blits at all.
+    """
+
+    def __init__(self, ai_game):
+        """Prepare the background used to erase sprites."""
+        self.screen = ai_game.screen
+        self.settings = ai_game.settings
+        # Sprites are erased with the background at rest; it doesn't
+        # scroll, or every frame would change the whole screen.
+        self.background = ai_game.background.static()
+        
+        self.last_sprites = []
+        self.last_overlay = []
+        self.last_rects = []
+        self.full_redraw = True
+
+    def invalidate(self):
+        """Redraw and present the whole screen on the next frame."""
+        self.full_redraw = True
+
+    def draw(self, sprites, overlay):
+        """
+        Draw sprites, then overlay (HUD and buttons) on top, each a list
+        of (image, position) pairs, and present what changed.
+        """
+        if self.full_redraw:
+            self.screen.blit(self.background, (0, 0))
+            rects = self.screen.blits(sprites)
+            rects.extend(self.screen.blits(overlay))
+            pygame.display.flip()
+            self.full_redraw = False
+        elif sprites != self.last_sprites or overlay != self.last_overlay:
+            # Erase everything drawn last frame, then draw this frame.
+            erased = self.last_rects
+            self.screen.blits([(self.background, rect, rect)
+                               for rect in erased], False)
+            rects = self.screen.blits(sprites)
+            rects.extend(self.screen.blits(overlay))
+            
+            changed = erased + rects
+            if len(changed) > self.settings.dirty_rect_limit:
+                # Past a point one full present beats many small ones.
+                pygame.display.flip()
+            else:
+                pygame.display.update(changed)
+        else:
+            return
+        
+        self.last_sprites = sprites
+        self.last_overlay = overlay
+        self.last_rects = rects
+
+class Swarm:
+    """
+    A class to run swarm mode, a stress test for sizing hardware.
+
+    The game plays swarm_waves fleets of fleet_size aliens. A wave ends
+    when its fleet is shot down or after swarm_wave_time seconds, and
+    the run ends after the last wave or at game over, with a report of
+    the frame rate it sustained.
+    """
+
+    def __init__(self, ai_game):
+        """Prepare an empty run."""
+        self.ai_game = ai_game
+        self.settings = ai_game.settings
+        self.wave = 0
+        self.level = 0
+        self.wave_time = 0.0
+        self.build_times = []
+        self.frame_times = []
+        self.last_frame = None
+
+    def start(self):
+        """Start a game, and with it the first wave."""
+        self.ai_game._start_game()
+        self._wave_started()
+
+    def _wave_started(self):
+        """Count the fleet the game just built."""
+        self.wave += 1
+        self.level = self.ai_game.stats.level
+        self.wave_time = 0.0
+        self.build_times.append(self.ai_game.fleet_build_time)
+
+    def end_frame(self):
+        """Time the frame that just ended, finer than the frame clock."""
+        now = perf_counter()
+        if self.last_frame is not None:
+            self.frame_times.append(now - self.last_frame)
+        self.last_frame = now
+
+    def update(self, dt):
+        """
+        Move the run on by a tick of dt seconds. Returns False once the
+        run is over.
+        """
+        ai_game = self.ai_game
+        if not ai_game.stats.game_active:
+            return False
+        if ai_game.stats.level != self.level:
+            # The last fleet was shot down and the game built the next.
+            if self.wave >= self.settings.swarm_waves:
+                return False
+            self._wave_started()
+        
+        self.wave_time += dt
+        if self.wave_time >= self.settings.swarm_wave_time:
+            if self.wave >= self.settings.swarm_waves:
+                return False
+            ai_game.aliens.empty()
+            ai_game._start_new_level()
+            self._wave_started()
+        return True
+
+    def report(self):
+        """Return the sustained frame rate and frame time percentiles."""
+        frame_ms = sorted(time * 1000.0 for time in self.frame_times)
+        total_ms = sum(frame_ms)
+        
+        def percentile(pct):
+            if not frame_ms:
+                return 0.0
+            rank = max(1, int(round(pct / 100.0 * len(frame_ms))))
+            return round(frame_ms[min(rank, len(frame_ms)) - 1], 3)
+        
+        return {
+            'aliens': self.settings.fleet_size,
+            'waves': self.wave,
+            'frames': len(frame_ms),
+            'seconds': round(total_ms / 1000.0, 3),
+            'fps': round(len(frame_ms) * 1000.0 / total_ms, 1)
+                   if total_ms else 0.0,
+            'frame_ms': {
+                'p50': percentile(50),
+                'p95': percentile(95),
+                'p99': percentile(99),
+                'max': round(frame_ms[-1], 3) if frame_ms else 0.0,
+            },
+            # The first build also loads the alien image.
+            'fleet_build_ms': [round(time * 1000.0, 3)
+                               for time in self.build_times],
+        }
+
+class FrameProfiler:
+    """
+    A class to time each phase of a frame, show the numbers on screen,
+    and export them.
+
+    The game adds the seconds spent in each phase as it runs, and
+    end_frame() files them with the frame time and entity counts. The
+    last window frames are kept, so every number is a rolling average.
+    """
+
+    PHASES = ('events', 'ship', 'bullets', 'collisions', 'aliens', 'screen')
+    # Seconds between redraws of the overlay text, so it stays readable.
+    OVERLAY_INTERVAL = 0.25
+
+    def __init__(self, ai_game):
+        """Prepare an empty window of frames."""
+        self.ai_game = ai_game
+        self.settings = ai_game.settings
+        self.frames = deque(maxlen=self.settings.profile_window)
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        
+        self.visible = False
+        self.font = ai_game.fonts.get(16)
+        self.text_color = (0, 255, 0)
+        self.overlay = []
+        self.overlay_time = 0.0
+        
+        self.start_time = perf_counter()
+        self.export_path = self.settings.metrics_path
+        self.export_time = self.start_time
+
+    def add(self, phase, seconds):
+        """Count seconds spent in phase during the current frame."""
+        self.current[phase] += seconds
+
+    def end_frame(self, frame_time):
+        """
+        Close the current frame, which took frame_time seconds from one
+        clock tick to the next, and start timing a new one.
+        """
+        ai_game = self.ai_game
+        self.frames.append((frame_time * 1000.0,
+                            [self.current[phase] * 1000.0
+                             for phase in self.PHASES],
+                            len(ai_game.bullets), len(ai_game.aliens)))
+        self.current = dict.fromkeys(self.PHASES, 0.0)
+        
+        now = perf_counter()
+        if self.visible and now - self.overlay_time >= self.OVERLAY_INTERVAL:
+            self.prep_overlay()
+        if (self.export_path is not None
+                and now - self.export_time >= self.settings.metrics_interval):
+            self.export()
+            self.export_time = now
+
+    def summary(self):
+        """Return the averages over the window as a dict of numbers."""
+        count = len(self.frames)
+        row = {'time': round(perf_counter() - self.start_time, 3),
+               'frames': count}
+        if not count:
+            return row
+        
+        frame_ms = [frame[0] for frame in self.frames]
+        mean_ms = sum(frame_ms) / count
+        row['fps'] = round(1000.0 / mean_ms, 1) if mean_ms else 0.0
+        row['frame_ms'] = round(mean_ms, 3)
+        row['frame_ms_max'] = round(max(frame_ms), 3)
+        last = self.frames[-1]
+        row['bullets'] = last[2]
+        row['aliens'] = last[3]
+        for index, phase in enumerate(self.PHASES):
+            total = sum(frame[1][index] for frame in self.frames)
+            row[phase + '_ms'] = round(total / count, 3)
+        return row
+
+    def export(self):
+        """
+        Append the current summary to export_path, as a CSV row if it
+        ends in .csv and as a line of JSON otherwise.
+        """
+        row = self.summary()
+        if not row['frames']:
+            return
+        try:
+            new_file = (not os.path.exists(self.export_path)
+                        or os.path.getsize(self.export_path) == 0)
+            with open(self.export_path, 'a', newline='') as f:
+                if self.export_path.endswith('.csv'):
+                    writer = csv.DictWriter(f, fieldnames=list(row))
+                    if new_file:
+                        writer.writeheader()
+                    writer.writerow(row)
+                else:
+                    f.write(json.dumps(row) + '\n')
+        except OSError:
+            print("Could not write metrics to " + self.export_path)
+            self.export_path = None
+
+    def toggle(self):
+        """Show or hide the overlay."""
+        self.visible = not self.visible
+        if self.visible:
+            self.prep_overlay()
+
+    def prep_overlay(self):
+        """Render the summary as lines of text in the bottom left corner."""
+        row = self.summary()
+        self.overlay_time = perf_counter()
+        if not row['frames']:
+            lines = ["profiling..."]
+        else:
+            lines = [
+                "FPS {:.1f}".format(row['fps']),
+                "frame {:.2f} ms  max {:.2f} ms".format(
+                    row['frame_ms'], row['frame_ms_max']),
+                "bullets {}  aliens {}".format(row['bullets'], row['aliens']),
+            ]
+            lines.extend("{} {:.3f} ms".format(phase, row[phase + '_ms'])
+                         for phase in self.PHASES)
+        
+        images = [self.font.render(line, True, self.text_color,
+                                   self.settings.bg_color) for line in lines]
+        y = self.settings.screen_height - 10
+        self.overlay = []
+        for image in reversed(images):
+            rect = image.get_rect()
+            rect.left = 10
+            rect.bottom = y
+            y = rect.top - 2
+            self.overlay.append((image, rect))
+
+    def overlay_items(self):
+        """Return the blits that draw the overlay, if it is shown."""
+        return list(self.overlay) if self.visible else []
 
 class AlienInvasion:
     
-    def __init__(self):
-        pygame.init()
-        pygame.mixer.init()  # Initialize the mixer for audio
-        self.settings = Settings()
-        self.screen = pygame.display.set_mode((self.settings.screen_width, self.settings.screen_height))
+    def __init__(self, headless=False, settings=None):
+        """
+        Set up the game. A headless game uses SDL's dummy video driver,
+        starts no audio, and is driven by run_headless() instead of
+        run_game(). settings replaces the default Settings if given.
+        """
+        self.headless = headless
+        self.settings = settings if settings is not None else Settings()
+        if headless:
+            # The dummy driver must be chosen before the display starts.
+            os.environ['SDL_VIDEODRIVER'] = 'dummy'
+        else:
+            # Ask for a small mixer buffer for low-latency effects. The
+            # mixer itself starts in the background once the window is up.
+            pygame.mixer.pre_init(self.settings.audio_frequency, -16, 2,
+                                  self.settings.audio_buffer)
+        # Only start what the game uses, instead of pygame.init().
+        pygame.display.init()
+        pygame.font.init()
+        if self.settings.vsync:
+            # pygame only honours vsync on a SCALED or OPENGL display.
+            self.screen = pygame.display.set_mode(
+                (self.settings.screen_width, self.settings.screen_height),
+                pygame.SCALED, vsync=1)
+        else:
+            self.screen = pygame.display.set_mode(
+                (self.settings.screen_width, self.settings.screen_height))
         pygame.display.set_caption("Alien Invasion")
 
+        # Images are decoded and scaled once, then shared by every sprite.
+        # Windowed games re-bake stale images; headless runs leave them be.
+        self.assets = AssetCache(bake=not headless)
+        # Fonts are loaded once per size and shared the same way.
+        self.fonts = FontRegistry()
+        
+        # Headless runs keep their scores to themselves.
+        scores_path = None if headless else self.settings.scores_path
+        self.leaderboard = Leaderboard(scores_path,
+                                       self.settings.leaderboard_size)
+
+        # Art and starfields behind the game, composited once.
+        self.background = Background(self)
+        
         self.stats = GameStats(self)
         self.sb = Scoreboard(self)
 
         self.ship = Ship(self, position='right')
-        self.bullets = Group()
-        self.aliens = Group()
+        self.bullets = BulletPool(self, self.settings.bullets_allowed)
+        self.aliens = self._make_fleet()
+        # Broadphase grid for the sprite fleet, rebuilt when aliens move.
+        self.alien_grid = SpatialHash(self.settings.collision_cell_size)
+        
+        # Frame clock for the fixed-timestep loop.
+        self.clock = pygame.time.Clock()
+        # Number of simulation ticks run so far.
+        self.sim_tick = 0
+        # Logs input for replays once start_recording() is called.
+        self.recorder = None
+        # Runs the game as a stress test once start_swarm() is called.
+        self.swarm = None
+        # Seconds the last _create_fleet() took.
+        self.fleet_build_time = 0.0
+        # Times each phase of the frame; F3 shows the numbers.
+        self.profiler = FrameProfiler(self)
+        # Picks up edits to the settings profile between frames.
+        if self.settings.profile_path is not None and not headless:
+            self.settings_watcher = SettingsWatcher(
+                self, self.settings.profile_path)
+        else:
+            self.settings_watcher = None
 
         # Create the Play button
         self.play_button = Button(self, "Play")
+        
+        if self.settings.renderer == 'dirty':
+            self.renderer = DirtyRenderer(self)
+        else:
+            self.renderer = None
 
         # Font for lives display
-        self.font = pygame.font.SysFont(None, 36)
+        self.font = self.fonts.get(24)
         
-        # Load and play background music
+        # Audio is loaded by start_audio() after the first frame, so
+        # effects are silent until it finishes.
+        self.sounds = SoundManager(self.settings)
+        self.audio_thread = None
+    
+    def start_audio(self):
+        """Start the mixer and load sounds on a background thread."""
+        if self.headless or self.audio_thread is not None:
+            return
+        self.audio_thread = threading.Thread(target=self._load_audio,
+                                             daemon=True)
+        self.audio_thread.start()
+    
+    def _load_audio(self):
+        """Start the background music and load the sound effects."""
         try:
-            pygame.mixer.music.load('234126__zagi2__chord-bassline-loop.wav')
+            pygame.mixer.init()  # Initialize the mixer for audio
+        except pygame.error:
+            print("Could not start audio")
+            return
+        
+        # Load and play background music
+        music_path = '234126__zagi2__chord-bassline-loop.wav'
+        if os.path.exists(music_path):
+            pygame.mixer.music.load(music_path)
             pygame.mixer.music.set_volume(0.3)  # Set background music volume to 30%
             pygame.mixer.music.play(-1)  # -1 means loop indefinitely
-        except:
+        else:
             print("Could not load background music")
         
-        # Load laser sound effect
-        try:
-            self.laser_sound = pygame.mixer.Sound('Assets/sound/laser.mp3')
-            self.laser_sound.set_volume(0.5)  # Set laser sound volume to 50%
-        except:
-            print("Could not load laser sound effect")
-            self.laser_sound = None
+        # Decode the sound effects up front and set aside their channels.
+        self.sounds.load()
 
     
     def run_game(self):
-        """Start the main loop for the game."""
+        """
+        Start the main loop for the game.
+
+        The simulation advances in fixed steps of 1 / sim_rate seconds,
+        however long each rendered frame takes. Rendering is capped by
+        fps_cap and draws sprites blended between the last two ticks.
+        """
+        step = 1.0 / self.settings.sim_rate
+        accumulator = 0.0
+        
+        # Get the first frame up before loading audio.
+        self._update_screen()
+        self.start_audio()
+        self.clock.tick()
+        
+        profiler = self.profiler
         while True:
+            frame_time = self.clock.tick(self.settings.fps_cap) / 1000.0
+            profiler.end_frame(frame_time)
+            if self.swarm is not None:
+                self.swarm.end_frame()
+            # Don't try to catch up on very long frames (e.g. a window drag).
+            frame_time = min(frame_time, self.settings.max_frame_time)
+            accumulator += frame_time * self.settings.sim_speed
+            
+            if self.settings_watcher is not None:
+                self.settings_watcher.poll()
+            
+            start = perf_counter()
             self._check_events()
+            profiler.add('events', perf_counter() - start)
+            
+            while accumulator >= step:
+                self._update_simulation(step)
+                accumulator -= step
+            
+            start = perf_counter()
+            self._update_screen(accumulator / step)
+            profiler.add('screen', perf_counter() - start)
+    
+    def run_headless(self, max_ticks=None, input_source=None, render=False):
+        """
+        Play one game as fast as possible, with no frame clock.
+
+        input_source is called as input_source(ai_game, tick) before each
+        tick and returns the events to handle (see ScriptedInput). The run
+        stops after max_ticks ticks or at game over. Nothing is drawn
+        unless render is True. Returns a summary of the finished run.
+        """
+        step = 1.0 / self.settings.sim_rate
+        self._start_game()
+        
+        ticks = 0
+        while max_ticks is None or ticks < max_ticks:
+            if input_source is not None:
+                for event in input_source(self, self.sim_tick):
+                    self._handle_event(event)
             
-            if self.stats.game_active:
-                self.ship.update()
-                self._update_bullets()
-                self._update_aliens()
+            self._update_simulation(step)
+            ticks += 1
+            if render:
+                self._update_screen()
             
-            self._update_screen()
+            if not self.stats.game_active:
+                break
+        
+        return {
+            'ticks': ticks,
+            'score': self.stats.score,
+            'level': self.stats.level,
+            'ships_left': self.stats.ships_left,
+            'game_over': not self.stats.game_active,
+        }
+    
+    def _update_simulation(self, dt):
+        """Advance the game by one simulation tick of dt seconds."""
+        if self.stats.state == 'playing':
+            start = perf_counter()
+            self.ship.update(dt)
+            self.profiler.add('ship', perf_counter() - start)
+            # _update_bullets times its own bullets and collisions phases.
+            self._update_bullets(dt)
+            start = perf_counter()
+            self._update_aliens(dt)
+            self.profiler.add('aliens', perf_counter() - start)
+            if self.swarm is not None and not self.swarm.update(dt):
+                self._quit()
+        elif self.stats.state == 'respawning':
+            # Everything holds still, but events are still handled.
+            self.stats.state_timer -= dt
+            if self.stats.state_timer <= 0:
+                self.stats.state = 'playing'
+        self.sim_tick += 1
+        
+        if self.recorder is not None:
+            self.recorder.on_tick(self)
+    
+    def start_swarm(self):
+        """Start a swarm stress test; it reports when the game quits."""
+        self.swarm = Swarm(self)
+        self.swarm.start()
+    
+    def start_recording(self, path):
+        """Log every input from now on to path, for Replay."""
+        self.recorder = Recorder(path, self)
+    
+    def snapshot(self):
+        """
+        Return the game state as compact bytes. Restoring them into
+        another game with the same settings clones this one.
+        """
+        return Snapshot.pack(self._capture_state())
+    
+    def restore(self, data):
+        """Put the game back into the state saved by snapshot()."""
+        self._restore_state(Snapshot.unpack(data))
+    
+    def suspend(self):
+        """Save the session to the snapshot file, then leave the game."""
+        path = self.settings.snapshot_path
+        if path is not None:
+            temp_path = path + '.tmp'
+            try:
+                with open(temp_path, 'wb') as f:
+                    f.write(self.snapshot())
+                os.replace(temp_path, path)
+            except OSError:
+                print("Could not save the session to " + path)
+        self._quit()
+    
+    def resume(self, path):
+        """Pick up a session suspended to path, with a short pause."""
+        try:
+            with open(path, 'rb') as f:
+                self.restore(f.read())
+        except (OSError, ValueError, struct.error, zlib.error):
+            print("Could not resume the session from " + path)
+            return
+        if self.stats.game_active:
+            pygame.mouse.set_visible(False)
+        if self.stats.state == 'playing':
+            self._pause(self.settings.start_pause)
+    
+    def _capture_state(self):
+        """
+        Return everything the simulation depends on as plain values, so
+        it can be restored exactly later.
+        """
+        settings = self.settings
+        if settings.fleet_backend == 'numpy':
+            fleet = self.aliens
+            alive = fleet.alive
+            aliens = [list(alien) for alien in zip(
+                fleet.x[alive].tolist(), fleet.y[alive].tolist(),
+                fleet.prev_y[alive].tolist())]
+        else:
+            aliens = [[alien.rect.x, alien.y, alien.prev_y]
+                      for alien in self.aliens.sprites()]
+        
+        return {
+            'sim_tick': self.sim_tick,
+            'stats': [self.stats.state, self.stats.state_timer,
+                      self.stats.ships_left, self.stats.score,
+                      self.stats.level, self.stats.high_score],
+            'settings': [settings.ship_speed, settings.bullet_speed,
+                         settings.alien_speed, settings.fleet_direction,
+                         settings.alien_points],
+            'ship': [self.ship.rect.x, self.ship.y, self.ship.prev_y,
+                     self.ship.moving_up, self.ship.moving_down],
+            'bullets': [[bullet.rect.x, bullet.rect.y, bullet.x,
+                         bullet.prev_x, bullet.direction]
+                        for bullet in self.bullets.sprites()],
+            'aliens': aliens,
+        }
+    
+    def _restore_state(self, state):
+        """Put the game back into a state from _capture_state()."""
+        settings = self.settings
+        self.sim_tick = state['sim_tick']
+        (self.stats.state, self.stats.state_timer, self.stats.ships_left,
+         self.stats.score, self.stats.level,
+         self.stats.high_score) = state['stats']
+        (settings.ship_speed, settings.bullet_speed, settings.alien_speed,
+         settings.fleet_direction, settings.alien_points) = state['settings']
+        
+        ship = self.ship
+        (ship.rect.x, ship.y, ship.prev_y,
+         ship.moving_up, ship.moving_down) = state['ship']
+        ship.rect.y = ship.y
+        
+        self.bullets.empty()
+        for rect_x, rect_y, x, prev_x, direction in state['bullets']:
+            bullet = self.bullets.fire(ship)
+            bullet.rect.topleft = (rect_x, rect_y)
+            bullet.x, bullet.prev_x = x, prev_x
+            bullet.direction = direction
+        
+        self.aliens.empty()
+        if settings.fleet_backend == 'numpy':
+            xs, ys, prev_ys = list(zip(*state['aliens'])) or ((), (), ())
+            self.aliens.set_positions(xs, ys, prev_ys)
+        else:
+            for x, y, prev_y in state['aliens']:
+                alien = Alien(self)
+                alien.rect.x = x
+                alien.y, alien.prev_y = y, prev_y
+                alien.rect.y = y
+                self.aliens.add(alien)
+        self.alien_grid.stale = True
+        
+        # Bring the HUD up to date and redraw everything.
+        self.sb.prep_score()
+        self.sb.prep_high_score()
+        self.sb.prep_level()
+        self.sb.prep_ships()
+        if self.renderer is not None:
+            self.renderer.invalidate()
+    
+    def _pause(self, seconds):
+        """Hold the game still for seconds of simulation time."""
+        self.stats.state = 'respawning'
+        self.stats.state_timer = seconds
     
     def _check_events(self):
         """Respond to keypresses and mouse events."""
         for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                sys.exit()
-            elif event.type == pygame.KEYDOWN:
-                self._check_keydown_events(event)
-            elif event.type == pygame.KEYUP:
-                self._check_keyup_events(event)
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                mouse_pos = pygame.mouse.get_pos()
-                self._check_play_button(mouse_pos)
+            self._handle_event(event)
+    
+    def _handle_event(self, event):
+        """Respond to a single keypress or mouse event."""
+        if self.recorder is not None:
+            self.recorder.record_event(self.sim_tick, event)
+        
+        if event.type == pygame.QUIT:
+            self._quit()
+        elif event.type == pygame.KEYDOWN:
+            self._check_keydown_events(event)
+        elif event.type == pygame.KEYUP:
+            self._check_keyup_events(event)
+        elif event.type == pygame.MOUSEBUTTONDOWN:
+            self._check_play_button(event.pos)
+        elif event.type == pygame.WINDOWEXPOSED and self.renderer:
+            # The window was uncovered; its old contents are gone.
+            self.renderer.invalidate()
 
     def _check_play_button(self, mouse_pos):
         """Start a new game when the player clicks Play."""
         button_clicked = self.play_button.rect.collidepoint(mouse_pos)
         if button_clicked and not self.stats.game_active:
-            # Reset the game settings.
-            self.settings.initialize_dynamic_settings()
-            
-            # Reset the game statistics.
-            self.stats.reset_stats()
-            self.stats.game_active = True
-            
-            # Get rid of any remaining aliens and bullets.
-            self.aliens.empty()
-            self.bullets.empty()
-            
-            # Create a new fleet and center the ship.
-            self._create_fleet()
-            self.ship.center_ship()
-            
-            # Hide the mouse cursor.
-            pygame.mouse.set_visible(False)
+            self._start_game()
             
             # Small delay to give player time to react
-            sleep(0.5)
+            self._pause(self.settings.start_pause)
+    
+    def _start_game(self):
+        """Reset the settings, statistics and sprites for a new game."""
+        # Reset the game settings.
+        self.settings.initialize_dynamic_settings()
+        
+        # Reset the game statistics.
+        self.stats.reset_stats()
+        self.stats.state = 'playing'
+        
+        # Get rid of any remaining aliens and bullets.
+        self.aliens.empty()
+        self.bullets.empty()
+        
+        # Create a new fleet and center the ship.
+        self._create_fleet()
+        self.ship.center_ship()
+        
+        # Hide the mouse cursor.
+        pygame.mouse.set_visible(False)
     
     def _check_keydown_events(self, event):
         """Respond to keypresses."""
@@ -424,7 +2607,20 @@ class AlienInvasion:
         elif event.key == pygame.K_SPACE:
             self._fire_bullet()
         elif event.key == pygame.K_q:
-            sys.exit()
+            self._quit()
+        elif event.key == pygame.K_F3:
+            self.profiler.toggle()
+        elif event.key == pygame.K_F5:
+            self.suspend()
+    
+    def _quit(self):
+        """Save any unsaved scores and recordings, and leave the game."""
+        self.leaderboard.close()
+        if self.recorder is not None:
+            self.recorder.close(self)
+        if self.swarm is not None:
+            print(json.dumps(self.swarm.report(), indent=2))
+        sys.exit()
     
     def _check_keyup_events(self, event):
         """Respond to key releases."""
@@ -436,61 +2632,119 @@ class AlienInvasion:
     def _fire_bullet(self):
         """Create a new bullet and add it to the bullets group."""
         if len(self.bullets) < self.settings.bullets_allowed:
-            new_bullet = Bullet(self)
-            self.bullets.add(new_bullet)
+            self.bullets.fire(self.ship)
             # Play laser sound effect
-            if hasattr(self, 'laser_sound') and self.laser_sound:
-                self.laser_sound.play()
+            self.sounds.play('laser')
     
-    def _update_bullets(self):
+    def _update_bullets(self, dt):
         """Update position of bullets and get rid of old bullets."""
-        # Update bullet positions.
-        self.bullets.update()
-        
-        # Get rid of bullets that have disappeared.
-        for bullet in self.bullets.copy():
-            if bullet.rect.right <= 0 or bullet.rect.left >= self.settings.screen_width:
-                self.bullets.remove(bullet)
+        # Update bullet positions. The pool gets rid of bullets that have
+        # disappeared as it goes, so the group is never copied.
+        start = perf_counter()
+        self.bullets.update(dt)
+        moved = perf_counter()
         
         self._check_bullet_alien_collisions()
+        self.profiler.add('bullets', moved - start)
+        self.profiler.add('collisions', perf_counter() - moved)
     
     def _check_bullet_alien_collisions(self):
         """Respond to bullet-alien collisions."""
         # Remove any bullets and aliens that have collided.
-        collisions = pygame.sprite.groupcollide(
-                self.bullets, self.aliens, True, True)
+        precise = self.settings.collision_shape == 'mask'
+        if self.settings.fleet_backend == 'numpy':
+            collisions = self.aliens.collide_group(self.bullets, precise)
+        elif self.settings.broadphase == 'grid':
+            collisions = self._collide_bullets_with_grid()
+        else:
+            collisions = pygame.sprite.groupcollide(
+                    self.bullets, self.aliens, True, True,
+                    self._collide_masks if precise else None)
         
         if collisions:
             for aliens in collisions.values():
                 self.stats.score += self.settings.alien_points * len(aliens)
+            self.sounds.play('impact')
             self.sb.prep_score()
             self.sb.check_high_score()
         
         if not self.aliens:
-            # Destroy existing bullets and create new fleet.
-            self.bullets.empty()
-            self._create_fleet()
-            self.settings.increase_speed()
-            
-            # Increase level.
-            self.stats.level += 1
-            self.sb.prep_level()
+            self._start_new_level()
+    
+    def _start_new_level(self):
+        """Bring in a new, faster fleet and go up a level."""
+        # Destroy existing bullets and create new fleet.
+        self.bullets.empty()
+        self._create_fleet()
+        self.settings.increase_speed()
+        
+        # Increase level.
+        self.stats.level += 1
+        self.sb.prep_level()
     
-    def _update_aliens(self):
+    def _current_alien_grid(self):
+        """Return the alien broadphase grid, rebuilding it if aliens moved."""
+        if self.alien_grid.stale:
+            self.alien_grid.rebuild(self.aliens)
+        return self.alien_grid
+    
+    def _collide_bullets_with_grid(self):
+        """
+        Remove bullets and the aliens they hit, with the same results as
+        groupcollide(bullets, aliens, True, True), testing only aliens in
+        the grid cells each bullet covers.
+        """
+        grid = self._current_alien_grid()
+        precise = self.settings.collision_shape == 'mask'
+        collisions = {}
+        for bullet in self.bullets.sprites():
+            hit = grid.collide(bullet.rect,
+                               mask=bullet.mask if precise else None)
+            if hit:
+                for alien in hit:
+                    alien.kill()
+                bullet.kill()
+                collisions[bullet] = hit
+        return collisions
+    
+    def _update_aliens(self, dt):
         """
         Check if the fleet is at an edge,
           then update the positions of all aliens in the fleet.
         """
         self._check_fleet_edges()
-        self.aliens.update()
+        self.aliens.update(dt)
+        self.alien_grid.shift(
+            0, self.settings.alien_speed * self.settings.fleet_direction * dt)
         
         # Look for alien-ship collisions.
-        if pygame.sprite.spritecollideany(self.ship, self.aliens):
+        if self._alien_hits_ship(self.ship):
             self._ship_hit()
         
         # Look for aliens hitting the bottom of the screen.
         self._check_aliens_bottom()
     
+    def _alien_hits_ship(self, ship):
+        """Return True if any alien touches ship."""
+        mask = ship.mask if self.settings.collision_shape == 'mask' else None
+        if self.settings.fleet_backend == 'numpy':
+            return self.aliens.collide_rect(ship.rect, mask)
+        if self.settings.broadphase == 'grid':
+            grid = self._current_alien_grid()
+            return bool(grid.collide(ship.rect, first_only=True, mask=mask))
+        return pygame.sprite.spritecollideany(
+            ship, self.aliens,
+            self._collide_masks if mask is not None else None) is not None
+    
+    @staticmethod
+    def _collide_masks(left, right):
+        """
+        Collision test for groupcollide: the rects must overlap, and then
+        the masks, so pixel tests only run on pairs that are close.
+        """
+        return (left.rect.colliderect(right.rect)
+                and pygame.sprite.collide_mask(left, right) is not None)
+    
     def _ship_hit(self):
         """Respond to the ship being hit by an alien."""
         if self.stats.ships_left > 0:
@@ -507,82 +2761,147 @@ class AlienInvasion:
             self.ship.center_ship()
             
             # Pause for 2 seconds to reset positions.
-            sleep(2.0)
+            self._pause(self.settings.respawn_pause)
         else:
-            self.stats.game_active = False
+            self.stats.state = 'game_over'
+            self.leaderboard.record(self.stats.score, self.stats.level)
             pygame.mouse.set_visible(True)
     
     def _check_aliens_bottom(self):
-        """Check if any aliens have reached the bottom of the screen."""
-        screen_rect = self.screen.get_rect()
-        for alien in self.aliens.sprites():
-            if alien.rect.bottom >= screen_rect.bottom:
-                # Don't end the game, just let them continue their pattern
-                break
+        """
+        Apply fleet_breach_rule if the fleet has reached the ship's side
+        of the screen, which is the bottom with the game on its side.
+        """
+        if self.settings.fleet_breach_rule == 'none':
+            # Don't end the game, just let them continue their pattern
+            return
+        bounds = self.aliens.bounds()
+        if bounds is not None and bounds.right >= self.settings.screen_width:
+            # Treat this the same as the ship getting hit.
+            self._ship_hit()
+    
+    def _make_fleet(self):
+        """Return an empty fleet for the configured fleet backend."""
+        if self.settings.fleet_backend == 'numpy':
+            if np is not None:
+                return NumpyFleet(self)
+            print("NumPy is not installed; using the sprite fleet")
+            self.settings.fleet_backend = 'sprites'
+        return AlienFleet(self)
+    
+    def _fleet_layout(self, alien_width, alien_height):
+        """
+        Return the number of aliens in a row and the x and y spacing
+        between them, from the formation settings.
+        """
+        settings = self.settings
+        total_aliens = settings.fleet_size
+        
+        # Calculate how many aliens fit in a row
+        available_space_x = settings.screen_width - (2 * alien_width)
+        fit_x = available_space_x // (2 * alien_width)
+        if settings.fleet_columns:
+            number_aliens_x = settings.fleet_columns
+        elif settings.fleet_rows:
+            number_aliens_x = -(-total_aliens // settings.fleet_rows)
+        else:
+            # Take as many as fit, but at least 6.
+            number_aliens_x = max(fit_x, 6)
+        
+        # Spacing between each alien is equal to one alien width, unless
+        # that won't fit.
+        spacing_x = settings.fleet_spacing_x
+        if not spacing_x:
+            if number_aliens_x <= fit_x:
+                spacing_x = 2 * alien_width
+            else:
+                spacing_x = max(1, available_space_x
+                                // max(1, number_aliens_x - 1))
+        
+        # Calculate number of rows needed to get exactly total_aliens, and
+        # space them out the same way.
+        number_rows = (total_aliens + number_aliens_x - 1) // number_aliens_x
+        spacing_y = settings.fleet_spacing_y
+        if not spacing_y:
+            spacing_y = 2 * alien_height
+            available_space_y = settings.screen_height - 100 - alien_height
+            if (number_rows - 1) * spacing_y > available_space_y:
+                spacing_y = max(1, available_space_y // (number_rows - 1))
+        
+        return number_aliens_x, spacing_x, spacing_y
     
     def _create_fleet(self):
         """Create the fleet of aliens."""
-        # Create an alien and find the number of aliens in a row.
-        # Spacing between each alien is equal to one alien width.
-        alien = Alien(self)
-        alien_width, alien_height = alien.rect.size
+        start = perf_counter()
+        self.alien_grid.stale = True
         
-        # We want exactly 30 aliens
-        total_aliens = 30
+        # Create an alien to measure; every alien shares its image.
+        alien = Alien(self)
+        number_aliens_x, spacing_x, spacing_y = self._fleet_layout(
+            *alien.rect.size)
         
-        # Calculate how many aliens fit in a row
-        available_space_x = self.settings.screen_width - (2 * alien_width)
-        number_aliens_x = available_space_x // (2 * alien_width)
+        # We want exactly fleet_size aliens (30 by default)
+        total_aliens = self.settings.fleet_size
         
-        # If we can't fit enough in a row, adjust spacing
-        if number_aliens_x < 6:
-            number_aliens_x = 6
-            spacing = available_space_x // (number_aliens_x - 1)
+        if self.settings.fleet_backend == 'numpy':
+            # Lay out the whole fleet in one go, in the same order.
+            index = np.arange(total_aliens)
+            xs = 50 + spacing_x * (index % number_aliens_x)
+            ys = 100 + spacing_y * (index // number_aliens_x)
+            self.aliens.set_positions(xs, ys)
         else:
-            spacing = 2 * alien_width
+            # Create exactly total_aliens aliens, row by row, and add
+            # them all at once.
+            self.aliens.add([
+                self._create_alien(
+                    50 + spacing_x * (index % number_aliens_x),
+                    100 + spacing_y * (index // number_aliens_x))
+                for index in range(total_aliens)])
         
-        # Calculate number of rows needed to get exactly 30 aliens
-        number_rows = (total_aliens + number_aliens_x - 1) // number_aliens_x
-        
-        # Create exactly 30 aliens
-        alien_count = 0
-        for row_number in range(number_rows):
-            for alien_number in range(number_aliens_x):
-                if alien_count < total_aliens:
-                    self._create_alien(alien_number, row_number, spacing)
-                    alien_count += 1
+        self.fleet_build_time = perf_counter() - start
     
-    def _create_alien(self, alien_number, row_number, spacing):
-        """Create an alien and place it in the row."""
+    def _create_alien(self, x, y):
+        """Create an alien at (x, y)."""
         alien = Alien(self)
-        alien_width, alien_height = alien.rect.size
-        # Start aliens from the left side of the screen
-        alien.rect.x = 50 + spacing * alien_number
-        # Start aliens higher up and with more spacing from top
-        alien.rect.y = 100 + 2 * alien.rect.height * row_number
+        alien.rect.x = x
+        alien.rect.y = y
         alien.y = float(alien.rect.y)
-        self.aliens.add(alien)
+        alien.prev_y = alien.y
+        return alien
     
     def _check_fleet_edges(self):
         """Respond appropriately if any aliens have reached an edge."""
-        for alien in self.aliens.sprites():
-            if alien.check_edges():
-                self._change_fleet_direction()
-                break
+        # Both fleets keep their bounding box, so this is a constant-time
+        # check however big the fleet is.
+        if self.aliens.check_edges():
+            self._change_fleet_direction()
     
     def _change_fleet_direction(self):
         """Move the entire fleet right and change the fleet's direction."""
-        for alien in self.aliens.sprites():
-            alien.rect.x += self.settings.fleet_drop_speed
+        self.aliens.drop(self.settings.fleet_drop_speed)
+        if self.settings.fleet_backend != 'numpy':
+            self.alien_grid.shift(self.settings.fleet_drop_speed, 0)
         self.settings.fleet_direction *= -1
     
-    def _update_screen(self):
-        """Update images on the screen, and flip to the new screen."""
-        self.screen.fill(self.settings.bg_color)
-        self.ship.blitme()
+    def _update_screen(self, alpha=1.0):
+        """
+        Update images on the screen, and flip to the new screen.
+        alpha is how far the frame falls between the last two ticks.
+        """
+        if self.renderer is not None:
+            self.renderer.draw(self._sprite_blits(alpha), self._overlay_blits())
+            return
+        
+        self.background.draw(
+            self.screen, (self.sim_tick + alpha) / self.settings.sim_rate)
+        self.ship.blitme(alpha)
         for bullet in self.bullets.sprites():
-            bullet.draw_bullet()
-        self.aliens.draw(self.screen)
+            bullet.draw_bullet(alpha)
+        if self.settings.fleet_backend == 'numpy':
+            self.aliens.draw(self.screen, alpha)
+        else:
+            self.screen.blits([(alien.image, alien.draw_rect(alpha))
+                               for alien in self.aliens.sprites()], False)
         
         # Draw the score information.
         self.sb.show_score()
@@ -591,9 +2910,94 @@ class AlienInvasion:
         if not self.stats.game_active:
             self.play_button.draw_button()
         
+        # Draw the frame profiler if it's shown.
+        self.screen.blits(self.profiler.overlay_items(), False)
+        
         pygame.display.flip()
+    
+    def _sprite_blits(self, alpha=1.0):
+        """Return (image, position) pairs for the ship, bullets and aliens."""
+        blits = [(self.ship.image, self.ship.draw_rect(alpha))]
+        blits.extend((bullet.image, bullet.draw_rect(alpha))
+                     for bullet in self.bullets.sprites())
+        if self.settings.fleet_backend == 'numpy':
+            blits.extend(self.aliens.blit_list(self.screen, alpha))
+        else:
+            blits.extend((alien.image, alien.draw_rect(alpha))
+                         for alien in self.aliens.sprites())
+        return blits
+    
+    def _overlay_blits(self):
+        """Return (image, rect) pairs for the HUD and the Play button."""
+        overlay = self.sb.hud_items()
+        if not self.stats.game_active:
+            overlay.extend(self.play_button.blit_items())
+        overlay.extend(self.profiler.overlay_items())
+        return overlay
 
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Play Alien Invasion.")
+    parser.add_argument('--settings', metavar='FILE',
+                        help="load settings from a JSON or TOML profile, "
+                             "and reload them when it changes")
+    parser.add_argument('--headless', action='store_true',
+                        help="simulate one game with no window or audio")
+    parser.add_argument('--ticks', type=int, default=None,
+                        help="stop a headless game after this many ticks")
+    parser.add_argument('--fleet-backend', choices=('sprites', 'numpy'),
+                        help="how to store the fleet")
+    parser.add_argument('--renderer', choices=('full', 'dirty'),
+                        help="how to present each frame")
+    parser.add_argument('--record', metavar='FILE',
+                        help="log this session's input to FILE")
+    parser.add_argument('--replay', metavar='FILE',
+                        help="re-simulate a recorded session headlessly")
+    parser.add_argument('--seek', type=int, metavar='TICK',
+                        help="with --replay, stop at TICK using keyframes")
+    parser.add_argument('--swarm', type=int, metavar='ALIENS',
+                        help="stress test with fleets of ALIENS aliens, "
+                             "uncapped, and report the frame rate")
+    parser.add_argument('--profile', action='store_true',
+                        help="start with the frame profiler shown (F3)")
+    parser.add_argument('--metrics', metavar='FILE',
+                        help="append frame metrics to FILE (.csv or .json)")
+    parser.add_argument('--resume', action='store_true',
+                        help="pick up the session suspended with F5")
+    args = parser.parse_args()
+    
+    settings = Settings(args.settings)
+    if args.fleet_backend is not None:
+        settings.fleet_backend = args.fleet_backend
+    if args.renderer is not None:
+        settings.renderer = args.renderer
+    if args.metrics is not None:
+        settings.metrics_path = args.metrics
+    if args.swarm:
+        settings.fleet_size = args.swarm
+        settings.fps_cap = 0
+    
     # Make a game instance, and run the game.
-    ai = AlienInvasion()
-    ai.run_game()
+    ai = AlienInvasion(headless=args.headless or bool(args.replay),
+                       settings=settings)
+    if args.replay:
+        replay = Replay(args.replay)
+        if args.seek is not None:
+            replay.seek(ai, args.seek)
+            print({'tick': ai.sim_tick, 'score': ai.stats.score,
+                   'level': ai.stats.level})
+        else:
+            print(replay.play(ai))
+    elif args.headless:
+        print(ai.run_headless(max_ticks=args.ticks))
+    else:
+        if args.record:
+            ai.start_recording(args.record)
+        if args.profile:
+            ai.profiler.toggle()
+        if args.swarm:
+            ai.start_swarm()
+        if args.resume and settings.snapshot_path is not None:
+            ai.resume(settings.snapshot_path)
+        ai.run_game()
@@ -0,0 +1,65 @@
+"""
+bake_assets.py
+Sprite Baking for Alien Invasion
+Purpose: save every sprite the game draws at its final size and
+rotation, with a manifest keyed by each source file's SHA-256, so the
+game loads them directly instead of scaling full-size images at startup
+
+Usage:
+    python bake_assets.py            # bake anything missing or stale
+    python bake_assets.py --force    # bake everything again
+    python bake_assets.py --check    # exit 1 if anything is stale
+"""
+
+import argparse
+import os
+import sys
+
+# The game loads its assets by relative path.
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+from alien_invasionGame import AssetCache
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--force', action='store_true',
+                        help="bake every sprite, fresh or not")
+    parser.add_argument('--check', action='store_true',
+                        help="only report; exit 1 if any bake is stale")
+    parser.add_argument('--clean', action='store_true',
+                        help="delete baked files no sprite uses any more")
+    args = parser.parse_args()
+
+    cache = AssetCache()
+    stale = []
+    for path, scale, rotation in AssetCache.SPRITES:
+        _, file_name = cache.baked_name(path, scale, rotation)
+        if args.check:
+            fresh = cache.is_fresh(path, scale, rotation)
+            if not fresh:
+                stale.append(file_name)
+            print("{:<28} {}".format(file_name, "fresh" if fresh else "stale"))
+            continue
+
+        baked = cache.bake(path, scale, rotation, force=args.force)
+        source_size = os.path.getsize(path)
+        baked_size = os.path.getsize(os.path.join(cache.baked_dir, file_name))
+        print("{:<28} {:<6} {:>9,} -> {:>7,} bytes".format(
+            file_name, "baked" if baked else "fresh", source_size, baked_size))
+
+    if args.clean and not args.check:
+        used = {cache.baked_name(*sprite)[0] for sprite in AssetCache.SPRITES}
+        for key in [key for key in cache.manifest if key not in used]:
+            entry = cache.manifest.pop(key)
+            os.remove(os.path.join(cache.baked_dir, entry['file']))
+            print("removed " + entry['file'])
+        cache.save_manifest()
+
+    if stale:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
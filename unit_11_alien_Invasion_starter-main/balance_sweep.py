@@ -0,0 +1,266 @@
+"""
+balance_sweep.py
+Balance Sweeps for Alien Invasion
+Purpose: play many headless games across a grid or random sample of
+settings on every core, and write levels reached, score curves and
+time to death for each game to one JSON file
+
+Usage:
+    python balance_sweep.py --grid speedup_scale=1.05,1.1,1.2 \\
+        --grid alien_speed=100,150,200 --games 20 --output sweep.json
+    python balance_sweep.py --random score_scale=1.2:2.0 \\
+        --random fleet_drop_speed=2:10 --samples 200 --player scripted
+"""
+
+import argparse
+import itertools
+import json
+import multiprocessing
+import os
+import random
+import sys
+from time import perf_counter
+
+# The game loads its assets by relative path.
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+# Keep pygame's banner out of the JSON on stdout.
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import pygame
+from alien_invasionGame import AlienInvasion, ScriptedInput, Settings
+
+
+class BotPlayer:
+    """A class to play by lining the ship up with the nearest alien."""
+
+    def __init__(self, seed):
+        """Aim a little off-center, differently for each seed."""
+        self.rng = random.Random(seed)
+        self.slack = 4
+
+    def target_y(self, ai_game):
+        """Return the center y of the alien closest to the ship."""
+        if ai_game.settings.fleet_backend == 'numpy':
+            fleet = ai_game.aliens
+            alive = fleet.alive.nonzero()[0]
+            if not len(alive):
+                return None
+            nearest = alive[fleet.x[alive].argmax()]
+            return fleet.y[nearest] + fleet.height[nearest] / 2
+        aliens = ai_game.aliens.sprites()
+        if not aliens:
+            return None
+        return max(aliens, key=lambda alien: alien.rect.right).rect.centery
+
+    def __call__(self, ai_game, tick):
+        """Return the key events for this tick."""
+        ship = ai_game.ship
+        target = self.target_y(ai_game)
+        if target is None:
+            return ()
+        target += self.rng.uniform(-self.slack, self.slack)
+
+        events = []
+        want_up = target < ship.rect.centery - self.slack
+        want_down = target > ship.rect.centery + self.slack
+        for key, want, moving in ((pygame.K_UP, want_up, ship.moving_up),
+                                  (pygame.K_DOWN, want_down,
+                                   ship.moving_down)):
+            if want and not moving:
+                events.append(pygame.event.Event(pygame.KEYDOWN, key=key))
+            elif moving and not want:
+                events.append(pygame.event.Event(pygame.KEYUP, key=key))
+        if not want_up and not want_down:
+            events.append(pygame.event.Event(pygame.KEYDOWN,
+                                             key=pygame.K_SPACE))
+        return events
+
+
+def scripted_player(seed, ticks):
+    """Return a ScriptedInput that fires steadily and wanders at random."""
+    rng = random.Random(seed)
+    script = ScriptedInput()
+    for tick in range(0, ticks, 25):
+        script.key_press(tick, pygame.K_SPACE)
+    tick = 0
+    while tick < ticks:
+        key = rng.choice((pygame.K_UP, pygame.K_DOWN))
+        hold = rng.randint(10, 200)
+        script.key_press(tick, key, hold)
+        tick += hold + rng.randint(0, 50)
+    return script
+
+
+def play_game(job):
+    """Play one headless game for a sweep job and return its results."""
+    settings = Settings()
+    settings.apply(job['settings'])
+    ai_game = AlienInvasion(headless=True, settings=settings)
+
+    if job['player'] == 'bot':
+        player = BotPlayer(job['seed'])
+    else:
+        player = scripted_player(job['seed'], job['max_ticks'])
+
+    # Sample the score once per simulated second, and note the tick each
+    # ship is lost.
+    sample_ticks = settings.sim_rate
+    curve = []
+    deaths = []
+    ships = [settings.ship_limit]
+
+    def tracked(ai, tick):
+        if tick % sample_ticks == 0:
+            curve.append(ai.stats.score)
+        if ai.stats.ships_left < ships[0]:
+            deaths.append(tick)
+        ships[0] = ai.stats.ships_left
+        return player(ai, tick)
+
+    start = perf_counter()
+    summary = ai_game.run_headless(max_ticks=job['max_ticks'],
+                                   input_source=tracked)
+    if summary['game_over']:
+        deaths.append(ai_game.sim_tick)
+
+    return {
+        'point': job['point'],
+        'settings': job['settings'],
+        'seed': job['seed'],
+        'level': summary['level'],
+        'score': summary['score'],
+        'game_over': summary['game_over'],
+        'seconds_played': summary['ticks'] / settings.sim_rate,
+        'death_seconds': [tick / settings.sim_rate for tick in deaths],
+        'score_curve': curve,
+        'wall_seconds': round(perf_counter() - start, 3),
+    }
+
+
+def parse_grid(text):
+    """Turn 'name=1,2,3' into ('name', [1, 2, 3])."""
+    name, _, values = text.partition('=')
+    return name, [json.loads(value) for value in values.split(',')]
+
+
+def parse_range(text):
+    """Turn 'name=low:high' into ('name', low, high)."""
+    name, _, bounds = text.partition('=')
+    low, _, high = bounds.partition(':')
+    return name, json.loads(low), json.loads(high)
+
+
+def make_points(grid, ranges, samples, rng):
+    """
+    Return the settings to try: every combination of the grid values,
+    each with samples random draws from the ranges if there are any.
+    Whole-number bounds draw whole numbers.
+    """
+    names = [name for name, _ in grid]
+    combos = [dict(zip(names, values))
+              for values in itertools.product(*(v for _, v in grid))]
+    if not ranges:
+        return combos
+
+    points = []
+    for combo in combos:
+        for _ in range(samples):
+            point = dict(combo)
+            for name, low, high in ranges:
+                if isinstance(low, int) and isinstance(high, int):
+                    point[name] = rng.randint(low, high)
+                else:
+                    point[name] = round(rng.uniform(low, high), 4)
+            points.append(point)
+    return points
+
+
+def summarize_points(games, points):
+    """Average the games played at each point."""
+    summaries = []
+    for index, point in enumerate(points):
+        played = [game for game in games if game['point'] == index]
+        if not played:
+            continue
+        count = len(played)
+        summaries.append({
+            'point': index,
+            'settings': point,
+            'games': count,
+            'mean_level': sum(game['level'] for game in played) / count,
+            'max_level': max(game['level'] for game in played),
+            'mean_score': sum(game['score'] for game in played) / count,
+            'mean_seconds_played': sum(game['seconds_played']
+                                       for game in played) / count,
+            'game_overs': sum(game['game_over'] for game in played),
+        })
+    return summaries
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--grid', action='append', type=parse_grid,
+                        default=[], metavar='NAME=V1,V2,...',
+                        help="try each listed value of a setting")
+    parser.add_argument('--random', action='append', type=parse_range,
+                        default=[], metavar='NAME=LOW:HIGH',
+                        help="draw a setting at random from a range")
+    parser.add_argument('--samples', type=int, default=50,
+                        help="random draws per grid point")
+    parser.add_argument('--games', type=int, default=4,
+                        help="games per point, each with its own seed")
+    parser.add_argument('--player', choices=('bot', 'scripted'),
+                        default='bot', help="who plays the games")
+    parser.add_argument('--max-minutes', type=float, default=10.0,
+                        help="simulated minutes before a game is cut off")
+    parser.add_argument('--fleet-backend', choices=('sprites', 'numpy'),
+                        default='sprites', help="how games store the fleet")
+    parser.add_argument('--processes', type=int, default=None,
+                        help="worker processes (default: one per core)")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    points = make_points(args.grid, args.random, args.samples, rng)
+
+    # Check every point up front rather than in the middle of a sweep.
+    for point in points:
+        try:
+            Settings().check(point)
+        except ValueError as error:
+            parser.error(str(error))
+
+    max_ticks = int(args.max_minutes * 60 * Settings().sim_rate)
+    jobs = []
+    for index, point in enumerate(points):
+        settings = dict(point, fleet_backend=args.fleet_backend)
+        for game in range(args.games):
+            jobs.append({'point': index, 'settings': settings,
+                         'seed': args.seed * 1000003 + game,
+                         'player': args.player, 'max_ticks': max_ticks})
+
+    start = perf_counter()
+    with multiprocessing.Pool(args.processes) as pool:
+        games = list(pool.imap_unordered(play_game, jobs, chunksize=1))
+    games.sort(key=lambda game: (game['point'], game['seed']))
+    print("Played {} games in {:.1f} s".format(len(games),
+                                               perf_counter() - start),
+          file=sys.stderr)
+
+    results = {
+        'player': args.player,
+        'max_minutes': args.max_minutes,
+        'points': summarize_points(games, points),
+        'games': games,
+    }
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,225 @@
+"""
+bench_frames.py
+Frame Phase Benchmarks for Alien Invasion
+Purpose: time each phase of a game frame at growing fleet and bullet
+counts, and write the results as JSON so builds can be compared
+
+Usage:
+    python bench_frames.py --output results.json
+    python bench_frames.py --baseline results.json --tolerance 0.2
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+from time import perf_counter
+
+# The game loads its assets by relative path.
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+# Keep pygame's banner out of the JSON on stdout.
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import pygame
+from alien_invasionGame import AlienInvasion, Settings
+
+# Methods of AlienInvasion that are timed on every call. Times are
+# inclusive, so _update_bullets also counts the collisions it runs.
+PHASES = (
+    '_update_bullets',
+    '_check_bullet_alien_collisions',
+    '_update_aliens',
+    '_check_fleet_edges',
+    '_create_fleet',
+    '_update_screen',
+)
+
+
+def percentile(samples, pct):
+    """Return the nearest-rank percentile of a list of samples."""
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    rank = max(1, int(round(pct / 100.0 * len(ordered))))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def summarize(samples):
+    """Return the percentiles of a list of millisecond timings."""
+    return {
+        'calls': len(samples),
+        'p50': percentile(samples, 50),
+        'p95': percentile(samples, 95),
+        'p99': percentile(samples, 99),
+        'mean': sum(samples) / len(samples) if samples else 0.0,
+        'total': sum(samples),
+    }
+
+
+def time_phases(ai_game, timings):
+    """Wrap each phase method on ai_game so its calls are timed."""
+    for name in PHASES:
+        method = getattr(ai_game, name)
+        samples = timings.setdefault(name, [])
+
+        def timed(*args, _method=method, _samples=samples):
+            start = perf_counter()
+            result = _method(*args)
+            _samples.append((perf_counter() - start) * 1000.0)
+            return result
+
+        setattr(ai_game, name, timed)
+
+
+def top_up_bullets(ai_game, count, rng):
+    """Fire until there are count bullets, spread across the screen."""
+    width = ai_game.settings.screen_width
+    while len(ai_game.bullets) < count:
+        before = len(ai_game.bullets)
+        ai_game._fire_bullet()
+        if len(ai_game.bullets) == before:
+            break
+    for bullet in ai_game.bullets.sprites():
+        if bullet.x == bullet.prev_x:
+            # A fresh bullet; scatter it so collisions look like play.
+            bullet.x = bullet.prev_x = rng.uniform(0, width)
+            bullet.rect.x = bullet.x
+            bullet.rect.y = rng.uniform(0, ai_game.settings.screen_height)
+
+
+def run_scenario(aliens, bullets, frames, seed, rebuilds=5,
+                 backend='sprites', renderer='full'):
+    """
+    Run one fleet/bullet size for a number of frames and time it, then
+    rebuild the fleet a few times so _create_fleet is timed warm too.
+    """
+    rng = random.Random(seed)
+    settings = Settings()
+    settings.fleet_backend = backend
+    settings.renderer = renderer
+    settings.fleet_size = aliens
+    settings.bullets_allowed = bullets
+    # Keep the fleet from drifting into the ship so the load stays steady.
+    settings.fleet_drop_speed = 0
+    ai_game = AlienInvasion(headless=True, settings=settings)
+
+    timings = {}
+    time_phases(ai_game, timings)
+    ai_game._start_game()
+
+    step = 1.0 / settings.sim_rate
+    frame_times = []
+    restarts = 0
+    for _ in range(frames):
+        top_up_bullets(ai_game, bullets, rng)
+        start = perf_counter()
+        ai_game._update_simulation(step)
+        ai_game._update_screen()
+        frame_times.append((perf_counter() - start) * 1000.0)
+        if not ai_game.stats.game_active:
+            ai_game._start_game()
+            restarts += 1
+
+    for _ in range(rebuilds):
+        ai_game.aliens.empty()
+        ai_game._create_fleet()
+
+    return {
+        'backend': backend,
+        'renderer': renderer,
+        'aliens': aliens,
+        'bullets': bullets,
+        'frames': frames,
+        'restarts': restarts,
+        'frame_ms': summarize(frame_times),
+        'phases_ms': {name: summarize(timings[name]) for name in PHASES},
+        'asset_cache': ai_game.assets.get_stats(),
+    }
+
+
+def find_regressions(results, baseline, tolerance):
+    """
+    Compare p95 frame times with a baseline run. Returns a list of
+    messages for scenarios more than tolerance (a fraction) slower.
+    """
+    def key_of(scenario):
+        return (scenario.get('backend', 'sprites'),
+                scenario.get('renderer', 'full'),
+                scenario['aliens'], scenario['bullets'])
+
+    old = {key_of(s): s for s in baseline['scenarios']}
+    regressions = []
+    for scenario in results['scenarios']:
+        key = key_of(scenario)
+        if key not in old:
+            continue
+        before = old[key]['frame_ms']['p95']
+        after = scenario['frame_ms']['p95']
+        if before > 0 and after > before * (1.0 + tolerance):
+            regressions.append(
+                "{}/{} aliens={} bullets={}: p95 {:.3f} ms -> {:.3f} ms"
+                .format(key[0], key[1], key[2], key[3], before, after))
+    return regressions
+
+
+def parse_counts(text):
+    """Turn a comma-separated list like '30,300' into integers."""
+    return [int(part) for part in text.split(',') if part]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--aliens', type=parse_counts,
+                        default=[30, 300, 1000, 3000, 10000],
+                        help="comma-separated fleet sizes")
+    parser.add_argument('--bullets', type=parse_counts, default=[3, 30, 300],
+                        help="comma-separated bullet counts")
+    parser.add_argument('--backends', default='sprites',
+                        help="comma-separated fleet backends to run")
+    parser.add_argument('--renderer', choices=('full', 'dirty'),
+                        default='full', help="screen renderer to time")
+    parser.add_argument('--frames', type=int, default=120,
+                        help="frames to time per scenario")
+    parser.add_argument('--rebuilds', type=int, default=5,
+                        help="extra fleet builds to time per scenario")
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    parser.add_argument('--baseline', help="JSON from an earlier run")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="allowed p95 slowdown against the baseline")
+    args = parser.parse_args()
+
+    results = {
+        'python': platform.python_version(),
+        'pygame': pygame.version.ver,
+        'platform': platform.platform(),
+        'scenarios': [],
+    }
+    for backend in args.backends.split(','):
+        for aliens in args.aliens:
+            for bullets in args.bullets:
+                results['scenarios'].append(
+                    run_scenario(aliens, bullets, args.frames, args.seed,
+                                 args.rebuilds, backend, args.renderer))
+
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = find_regressions(results, baseline, args.tolerance)
+        for message in regressions:
+            print("REGRESSION " + message, file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
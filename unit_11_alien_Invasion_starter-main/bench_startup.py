@@ -0,0 +1,87 @@
+"""
+bench_startup.py
+Startup Benchmark for Alien Invasion
+Purpose: measure how long a fresh process takes to put the first frame
+on screen, and how long audio takes to finish loading behind it
+
+Usage:
+    python bench_startup.py --runs 10 --output startup.json
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from time import perf_counter, time
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def child():
+    """Start the game once in this process and print the timings as JSON."""
+    start = perf_counter()
+    os.chdir(HERE)
+    os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+    sys.path.insert(0, HERE)
+
+    from alien_invasionGame import AlienInvasion
+    imported = perf_counter()
+
+    ai_game = AlienInvasion()
+    initialized = perf_counter()
+
+    ai_game._update_screen()
+    first_frame = perf_counter()
+    first_frame_wall = time()
+
+    ai_game.start_audio()
+    ai_game.audio_thread.join()
+    audio_ready = perf_counter()
+
+    print(json.dumps({
+        'import': (imported - start) * 1000.0,
+        'init': (initialized - imported) * 1000.0,
+        'first_frame': (first_frame - start) * 1000.0,
+        'audio_ready': (audio_ready - start) * 1000.0,
+        'first_frame_wall': first_frame_wall,
+    }))
+
+
+def main():
+    from bench_frames import summarize
+
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('--runs', type=int, default=10,
+                        help="fresh processes to start")
+    parser.add_argument('--output', help="write JSON here instead of stdout")
+    args = parser.parse_args()
+
+    samples = {}
+    for _ in range(args.runs):
+        launched = time()
+        output = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), '--child'],
+            check=True, capture_output=True, text=True).stdout
+        # The game may print warnings first; the timings are the last line.
+        timings = json.loads(output.strip().splitlines()[-1])
+        # Include interpreter startup, as a player would see it.
+        timings['process_first_frame'] = (
+            (timings.pop('first_frame_wall') - launched) * 1000.0)
+        for name, value in timings.items():
+            samples.setdefault(name, []).append(value)
+
+    results = {name: summarize(values) for name, values in samples.items()}
+    text = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == '__main__':
+    if '--child' in sys.argv:
+        child()
+    else:
+        main()
@@ -0,0 +1,828 @@
+"""
+netplay.py
+Two-Player Alien Invasion over UDP
+Purpose: play with a ship on each side of the screen and one client per
+player, while a server runs the only real game and sends each client
+just what changed since the last state that client confirmed
+
+Usage:
+    python netplay.py server --players 2
+    python netplay.py client localhost
+    python netplay.py client localhost --headless --ticks 6000
+    python netplay.py server --loss 0.1 --latency 0.05 --jitter 0.02
+"""
+
+import argparse
+import heapq
+import os
+import random
+import socket
+import struct
+from collections import Counter, deque
+from time import perf_counter, sleep
+
+# The game loads its assets by relative path.
+os.chdir(os.path.dirname(os.path.abspath(__file__)))
+os.environ['PYGAME_HIDE_SUPPORT_PROMPT'] = '1'
+
+import pygame
+from alien_invasionGame import AlienInvasion, Button, Settings, Ship, Snapshot
+
+# Every packet starts with the magic, the protocol version and its kind.
+MAGIC = b'AN'
+VERSION = 1
+PACKET = struct.Struct('<2sBB')
+HELLO, WELCOME, INPUT, STATE, BYE = range(5)
+WELCOME_BODY = struct.Struct('<BHB')    # slot, sim_rate, send_interval
+INPUT_BODY = struct.Struct('<IIB')      # state tick held, first seq, count
+STATE_BODY = struct.Struct('<IIIB')     # tick, baseline tick, input ack, flags
+NO_BASELINE = 0xFFFFFFFF
+
+# Input bits; one byte per tick.
+UP, DOWN, FIRE = 1, 2, 4
+
+# Positions go over the wire in quarter pixels, as 16-bit ints.
+SCALE = 4
+
+# Ticks between state packets, inputs repeated in every input packet (so
+# a lost packet costs nothing), and states each side keeps as baselines.
+SEND_INTERVAL = 2
+INPUT_REDUNDANCY = 12
+HISTORY = 128
+
+# Seconds of silence before the server gives up on a client.
+TIMEOUT = 5.0
+
+
+def quantize(value):
+    """Return value in quarter pixels, clamped to a 16-bit int."""
+    return max(-32768, min(32767, int(round(value * SCALE))))
+
+
+def pack_list(record, items):
+    """Return a count followed by each item packed with record."""
+    return struct.pack('<H', len(items)) + b''.join(
+        record.pack(*item) for item in items)
+
+
+def unpack_list(record, data, offset):
+    """Read a list written by pack_list(). Returns it and the new offset."""
+    count, = struct.unpack_from('<H', data, offset)
+    offset += 2
+    end = offset + count * record.size
+    return list(record.iter_unpack(data[offset:end])), end
+
+
+def receive_all(sock):
+    """Yield every (kind, data, address) waiting on a non-blocking socket."""
+    while True:
+        try:
+            data, address = sock.recvfrom(65536)
+        except BlockingIOError:
+            return
+        except ConnectionResetError:
+            # Windows reports an unreachable peer this way; skip it.
+            continue
+        if len(data) < PACKET.size:
+            continue
+        magic, version, kind = PACKET.unpack_from(data)
+        if magic == MAGIC and version == VERSION:
+            yield kind, data, address
+
+
+class LossyLink:
+    """
+    A class to send datagrams through a simulated bad network: each
+    packet is dropped with probability loss, and the rest are held back
+    for latency seconds, give or take jitter, so they can arrive out of
+    order. With no loss or latency, packets go straight out.
+    """
+
+    def __init__(self, sock, loss=0.0, latency=0.0, jitter=0.0, seed=None):
+        """Wrap sock."""
+        self.sock = sock
+        self.loss = loss
+        self.latency = latency
+        self.jitter = jitter
+        self.rng = random.Random(seed)
+        # (due time, order sent, data, address) for held-back packets.
+        self.pending = []
+        self.order = 0
+        self.packets = 0
+        self.bytes = 0
+        self.dropped = 0
+
+    def sendto(self, data, address):
+        """Send data to address, or drop or delay it."""
+        self.packets += 1
+        self.bytes += len(data)
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency + self.rng.uniform(-self.jitter, self.jitter)
+        if delay <= 0:
+            self._send(data, address)
+            return
+        self.order += 1
+        heapq.heappush(self.pending,
+                       (perf_counter() + delay, self.order, data, address))
+
+    def flush(self):
+        """Send the held-back packets that are due."""
+        now = perf_counter()
+        while self.pending and self.pending[0][0] <= now:
+            _, _, data, address = heapq.heappop(self.pending)
+            self._send(data, address)
+
+    def _send(self, data, address):
+        try:
+            self.sock.sendto(data, address)
+        except OSError:
+            # UDP makes no promises; a failed send is a lost packet.
+            self.dropped += 1
+
+
+class CoopGame(AlienInvasion):
+    """
+    A class to play with the usual ship on the right (slot 0) and a
+    second ship on the left (slot 1), against one fleet, for a shared
+    score. Aliens and bullets carry ids so states can be diffed.
+
+    Ids come from _create_alien(), so the fleet must be the sprite one.
+    """
+
+    def __init__(self, headless=True, settings=None):
+        """Set up the game with a ship for each player."""
+        super().__init__(headless=headless, settings=settings)
+        self.ships = [self.ship, Ship(self, position='left')]
+        self.next_alien_id = 0
+        self.next_bullet_id = 0
+
+    def fire(self, slot):
+        """Fire from a player's ship if they have a bullet to spare."""
+        owned = sum(1 for bullet in self.bullets.spritedict
+                    if bullet.owner == slot)
+        if owned >= self.settings.bullets_allowed:
+            return
+        bullet = self.bullets.fire(self.ships[slot])
+        bullet.owner = slot
+        bullet.net_id = self.next_bullet_id
+        self.next_bullet_id = (self.next_bullet_id + 1) % 65536
+        # Clients fly the bullet themselves from where and when it left.
+        bullet.spawn = (bullet.direction, quantize(bullet.x),
+                        quantize(bullet.rect.y), self.sim_tick,
+                        self.settings.bullet_speed)
+
+    def _fleet_layout(self, alien_width, alien_height):
+        """Lay the fleet out as usual, less the columns the left ship needs."""
+        columns, spacing_x, spacing_y = super()._fleet_layout(
+            alien_width, alien_height)
+        lost = -(-self.ships[1].rect.width // spacing_x)
+        return max(1, columns - lost), spacing_x, spacing_y
+
+    def _create_alien(self, x, y):
+        """Create an alien clear of the left ship, with the next id."""
+        alien = super()._create_alien(x + self.ships[1].rect.width, y)
+        alien.net_id = self.next_alien_id
+        self.next_alien_id = (self.next_alien_id + 1) % 65536
+        return alien
+
+    def _start_game(self):
+        """Start a new game with both ships centered and still."""
+        super()._start_game()
+        for ship in self.ships:
+            ship.center_ship()
+            ship.moving_up = ship.moving_down = False
+
+    def _update_simulation(self, dt):
+        """Move the left ship as well as the rest of the game."""
+        if self.stats.state == 'playing':
+            self.ships[1].update(dt)
+        super()._update_simulation(dt)
+
+    def _update_aliens(self, dt):
+        """Move the fleet, and let it hit the left ship as well."""
+        super()._update_aliens(dt)
+        if (self.stats.state == 'playing'
+                and self._alien_hits_ship(self.ships[1])):
+            self._ship_hit()
+
+    def _ship_hit(self):
+        """Lose a shared ship, and put both ships back in the middle."""
+        super()._ship_hit()
+        self.ships[1].center_ship()
+
+
+class NetState:
+    """
+    A class to hold one tick of a CoopGame as the clients see it: the
+    scores, and quantized positions keyed by id, so that two states can
+    be diffed into a small packet and the packet applied to rebuild one.
+
+    Aliens all move together, so a diff sends one shift for the fleet
+    and lists only the aliens that didn't follow it. Bullets fly in a
+    straight line at a fixed speed, so they are only sent when fired
+    and when gone.
+    """
+
+    # Flags for the parts of a state packet, which follow in this order.
+    SCALARS, SHIPS, SHIFT, ALIENS_GONE, ALIENS_SET, BULLETS_GONE, \
+        BULLETS_NEW = (1 << bit for bit in range(7))
+    SCALAR_FIELDS = struct.Struct('<BBHIf')  # state, ships left, level,
+                                             # score, ship_speed
+    SHIP_FIELDS = struct.Struct('<hh')       # right and left ship y
+    SHIFT_FIELDS = struct.Struct('<hh')      # dx, dy of the whole fleet
+    ID = struct.Struct('<H')
+    ALIEN = struct.Struct('<Hhh')            # id, x, y
+    BULLET = struct.Struct('<HbhhIf')        # id, direction, x, y, tick
+                                             # fired, speed
+
+    def __init__(self, tick=NO_BASELINE):
+        """Start empty, which is the baseline for a full state."""
+        self.tick = tick
+        self.scalars = None
+        self.ships = None
+        self.aliens = {}
+        self.bullets = {}
+
+    @classmethod
+    def capture(cls, game):
+        """Return the state of a CoopGame as it is now."""
+        state = cls(game.sim_tick)
+        stats = game.stats
+        state.scalars = (Snapshot.STATES.index(stats.state), stats.ships_left,
+                         stats.level, stats.score, game.settings.ship_speed)
+        state.ships = tuple(quantize(ship.y) for ship in game.ships)
+        state.aliens = {alien.net_id: (quantize(alien.rect.x),
+                                       quantize(alien.y))
+                        for alien in game.aliens.spritedict}
+        state.bullets = {bullet.net_id: bullet.spawn
+                         for bullet in game.bullets.spritedict}
+        return state
+
+    def encode(self, baseline, input_ack):
+        """
+        Return a state packet that turns baseline (None for a client with
+        nothing yet) into this state. input_ack is the newest input the
+        server has applied for the client.
+        """
+        if baseline is None:
+            baseline = NetState()
+        flags = 0
+        parts = []
+        if self.scalars != baseline.scalars:
+            flags |= self.SCALARS
+            parts.append(self.SCALAR_FIELDS.pack(*self.scalars))
+        if self.ships != baseline.ships:
+            flags |= self.SHIPS
+            parts.append(self.SHIP_FIELDS.pack(*self.ships))
+
+        # Find how most of the aliens moved, and send that once.
+        old = baseline.aliens
+        moves = Counter((x - old[key][0], y - old[key][1])
+                        for key, (x, y) in self.aliens.items() if key in old)
+        shift = moves.most_common(1)[0][0] if moves else (0, 0)
+        if not all(-32768 <= d <= 32767 for d in shift):
+            shift = (0, 0)
+        if shift != (0, 0):
+            flags |= self.SHIFT
+            parts.append(self.SHIFT_FIELDS.pack(*shift))
+        gone = [(key,) for key in old if key not in self.aliens]
+        if gone:
+            flags |= self.ALIENS_GONE
+            parts.append(pack_list(self.ID, gone))
+        changed = [(key, x, y) for key, (x, y) in self.aliens.items()
+                   if key not in old or (x - old[key][0],
+                                         y - old[key][1]) != shift]
+        if changed:
+            flags |= self.ALIENS_SET
+            parts.append(pack_list(self.ALIEN, changed))
+
+        gone = [(key,) for key in baseline.bullets if key not in self.bullets]
+        if gone:
+            flags |= self.BULLETS_GONE
+            parts.append(pack_list(self.ID, gone))
+        fired = [(key,) + spawn for key, spawn in self.bullets.items()
+                 if key not in baseline.bullets]
+        if fired:
+            flags |= self.BULLETS_NEW
+            parts.append(pack_list(self.BULLET, fired))
+
+        header = PACKET.pack(MAGIC, VERSION, STATE) + STATE_BODY.pack(
+            self.tick, baseline.tick, input_ack, flags)
+        return header + b''.join(parts)
+
+    @classmethod
+    def decode(cls, data, offset, tick, flags, baseline):
+        """Return the state a packet body makes from baseline."""
+        state = cls(tick)
+        state.scalars = baseline.scalars
+        state.ships = baseline.ships
+        if flags & cls.SCALARS:
+            state.scalars = cls.SCALAR_FIELDS.unpack_from(data, offset)
+            offset += cls.SCALAR_FIELDS.size
+        if flags & cls.SHIPS:
+            state.ships = cls.SHIP_FIELDS.unpack_from(data, offset)
+            offset += cls.SHIP_FIELDS.size
+
+        dx = dy = 0
+        if flags & cls.SHIFT:
+            dx, dy = cls.SHIFT_FIELDS.unpack_from(data, offset)
+            offset += cls.SHIFT_FIELDS.size
+        gone = ()
+        if flags & cls.ALIENS_GONE:
+            gone, offset = unpack_list(cls.ID, data, offset)
+            gone = {key for key, in gone}
+        state.aliens = {key: (x + dx, y + dy)
+                        for key, (x, y) in baseline.aliens.items()
+                        if key not in gone}
+        if flags & cls.ALIENS_SET:
+            changed, offset = unpack_list(cls.ALIEN, data, offset)
+            for key, x, y in changed:
+                state.aliens[key] = (x, y)
+
+        gone = ()
+        if flags & cls.BULLETS_GONE:
+            gone, offset = unpack_list(cls.ID, data, offset)
+            gone = {key for key, in gone}
+        state.bullets = {key: spawn for key, spawn in baseline.bullets.items()
+                         if key not in gone}
+        if flags & cls.BULLETS_NEW:
+            fired, offset = unpack_list(cls.BULLET, data, offset)
+            for key, *spawn in fired:
+                state.bullets[key] = tuple(spawn)
+        return state
+
+
+class Player:
+    """A class to track one client on the server."""
+
+    def __init__(self, address, slot):
+        """Start with no input and no state confirmed."""
+        self.address = address
+        self.slot = slot
+        # (seq, bits) received but not applied yet, one per tick.
+        self.inputs = deque(maxlen=HISTORY)
+        self.last_seq = 0
+        # Newest input applied, and newest state the client has.
+        self.input_ack = 0
+        self.state_ack = None
+        self.last_heard = perf_counter()
+
+
+class Server:
+    """
+    A class to run the one real game and stream it to the players.
+
+    Each tick applies one input from every player; every SEND_INTERVAL
+    ticks each player gets the changes since the newest state they
+    confirmed, or the whole state if that one is too old.
+    """
+
+    def __init__(self, settings, port, players=2, link_options=None):
+        """Bind the port and set up the game; it starts once all join."""
+        settings.fleet_backend = 'sprites'
+        self.game = CoopGame(headless=True, settings=settings)
+        self.step = 1.0 / settings.sim_rate
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(('', port))
+        self.sock.setblocking(False)
+        self.link = LossyLink(self.sock, **(link_options or {}))
+
+        self.player_count = players
+        self.players = {}
+        self.started = False
+        # States sent, by tick, to diff later states against.
+        self.history = {}
+        self.full_states = 0
+        self.delta_states = 0
+
+    def receive(self):
+        """Handle every packet waiting on the socket."""
+        for kind, data, address in receive_all(self.sock):
+            player = self.players.get(address)
+            if kind == HELLO:
+                if player is None:
+                    player = self._join(address)
+                if player is not None:
+                    # Repeated HELLOs mean the WELCOME was lost.
+                    self.link.sendto(
+                        PACKET.pack(MAGIC, VERSION, WELCOME)
+                        + WELCOME_BODY.pack(player.slot,
+                                            self.game.settings.sim_rate,
+                                            SEND_INTERVAL),
+                        address)
+            elif player is None:
+                continue
+            elif kind == INPUT:
+                self._read_input(player, data)
+            elif kind == BYE:
+                print("Player {} left".format(player.slot + 1))
+                del self.players[address]
+
+    def _join(self, address):
+        """Give address the first free slot, or None if the game is full."""
+        taken = {player.slot for player in self.players.values()}
+        free = [slot for slot in range(self.player_count) if slot not in taken]
+        if not free:
+            return None
+        player = Player(address, free[0])
+        self.players[address] = player
+        print("Player {} joined from {}:{}".format(player.slot + 1, *address))
+        return player
+
+    def _read_input(self, player, data):
+        """Queue the inputs in a packet that haven't been seen before."""
+        player.last_heard = perf_counter()
+        state_tick, first_seq, count = INPUT_BODY.unpack_from(data,
+                                                              PACKET.size)
+        if state_tick != NO_BASELINE and (player.state_ack is None
+                                          or state_tick > player.state_ack):
+            player.state_ack = state_tick
+        bits = data[PACKET.size + INPUT_BODY.size:][:count]
+        for seq, value in enumerate(bits, first_seq):
+            if seq > player.last_seq:
+                player.inputs.append((seq, value))
+                player.last_seq = seq
+
+    def tick(self):
+        """Apply one input per player, step the game, and send states."""
+        game = self.game
+        now = perf_counter()
+        for address, player in list(self.players.items()):
+            if now - player.last_heard > TIMEOUT:
+                print("Player {} timed out".format(player.slot + 1))
+                del self.players[address]
+
+        if not self.started and len(self.players) == self.player_count:
+            game._start_game()
+            game._pause(game.settings.start_pause)
+            self.started = True
+
+        for player in self.players.values():
+            if not player.inputs:
+                # A late input holds the ship as it was; it's used later.
+                continue
+            seq, bits = player.inputs.popleft()
+            player.input_ack = seq
+            ship = game.ships[player.slot]
+            ship.moving_up = bool(bits & UP)
+            ship.moving_down = bool(bits & DOWN)
+            if bits & FIRE and game.stats.game_active:
+                game.fire(player.slot)
+
+        game._update_simulation(self.step)
+        if game.sim_tick % SEND_INTERVAL == 0:
+            self.send_states()
+
+    def send_states(self):
+        """Send every player what changed since the state they hold."""
+        state = NetState.capture(self.game)
+        self.history[state.tick] = state
+        self.history.pop(state.tick - HISTORY * SEND_INTERVAL, None)
+        for player in self.players.values():
+            baseline = self.history.get(player.state_ack)
+            if baseline is None:
+                self.full_states += 1
+            else:
+                self.delta_states += 1
+            self.link.sendto(state.encode(baseline, player.input_ack),
+                             player.address)
+
+    def run(self, max_ticks=None):
+        """Serve until the game has been over a second, or max_ticks."""
+        game = self.game
+        next_tick = perf_counter()
+        over_ticks = 0
+        start = next_tick
+        while max_ticks is None or game.sim_tick < max_ticks:
+            self.receive()
+            self.link.flush()
+            now = perf_counter()
+            if now < next_tick:
+                sleep(min(next_tick - now, 0.001))
+                continue
+            # Don't try to catch up after a long stall.
+            next_tick = max(next_tick + self.step,
+                            now - game.settings.max_frame_time)
+            self.tick()
+            if game.stats.state == 'game_over':
+                over_ticks += 1
+                if over_ticks > game.settings.sim_rate:
+                    break
+
+        seconds = perf_counter() - start
+        return {
+            'ticks': game.sim_tick,
+            'score': game.stats.score,
+            'level': game.stats.level,
+            'full_states': self.full_states,
+            'delta_states': self.delta_states,
+            'packets_sent': self.link.packets,
+            'bytes_sent': self.link.bytes,
+            'mean_state_bytes': round(self.link.bytes
+                                      / max(1, self.link.packets), 1),
+            'kbit_per_second': round(self.link.bytes * 8 / 1000
+                                     / max(seconds, 1e-9), 1),
+            'dropped': self.link.dropped,
+        }
+
+
+class Client:
+    """
+    A class to play one side of a networked game.
+
+    Each tick sends this player's input (with the last few, in case
+    some were lost) and moves the local ship at once, rather than a
+    round trip later. When a state arrives, the local ship is put where
+    the server had it and the inputs the server hasn't used yet are
+    played again on top, so predictions never drift.
+    """
+
+    def __init__(self, settings, host, port, headless=False,
+                 link_options=None, seed=None):
+        """Open a socket to the server and set up the screen."""
+        settings.fleet_backend = 'sprites'
+        self.game = CoopGame(headless=headless, settings=settings)
+        self.headless = headless
+        self.settings = settings
+        self.step = 1.0 / settings.sim_rate
+        self.server = (socket.gethostbyname(host), port)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+        self.link = LossyLink(self.sock, **(link_options or {}))
+        self.rng = random.Random(seed)
+
+        self.slot = None
+        # States received, by tick and in order, to use as baselines.
+        self.states = {}
+        self.state_ticks = deque()
+        self.latest = None
+        # Ticks played since the latest state, to fly bullets forward.
+        self.ticks_since_state = 0
+        self.input_seq = 0
+        self.pending = deque(maxlen=HISTORY)
+        self.fire_pressed = False
+        self.bot_hold = 0
+        self.bot_bits = 0
+
+        self.states_received = 0
+        self.received_packets = 0
+        self.received_bytes = 0
+        self.prediction_errors = []
+
+        self.alien_image = self.game.assets.image('2ndALIENship.png', 0.03)
+        self.bullet_image = self.game.assets.image('2ndlazer.png', 0.1)
+        self.game_over_button = Button(self.game, "Game Over")
+
+    def receive(self):
+        """Handle every packet waiting on the socket."""
+        for kind, data, address in receive_all(self.sock):
+            if address != self.server:
+                continue
+            self.received_packets += 1
+            self.received_bytes += len(data)
+            if kind == WELCOME and self.slot is None:
+                self.slot, sim_rate, _ = WELCOME_BODY.unpack_from(
+                    data, PACKET.size)
+                if sim_rate != self.settings.sim_rate:
+                    print("The server runs at {} ticks a second; so will "
+                          "we".format(sim_rate))
+                    self.settings.sim_rate = sim_rate
+                    self.step = 1.0 / sim_rate
+            elif kind == STATE and self.slot is not None:
+                self._read_state(data)
+
+    def _read_state(self, data):
+        """Rebuild a state from its packet and catch up with it."""
+        tick, base_tick, input_ack, flags = STATE_BODY.unpack_from(
+            data, PACKET.size)
+        if self.latest is not None and tick <= self.latest.tick:
+            # Late or repeated; a newer state is already here.
+            return
+        if base_tick == NO_BASELINE:
+            baseline = NetState()
+        else:
+            baseline = self.states.get(base_tick)
+            if baseline is None:
+                return
+        state = NetState.decode(data, PACKET.size + STATE_BODY.size, tick,
+                                flags, baseline)
+        self.states_received += 1
+        self.states[tick] = state
+        self.state_ticks.append(tick)
+        if len(self.state_ticks) > HISTORY:
+            del self.states[self.state_ticks.popleft()]
+
+        scalars_changed = (self.latest is None
+                           or state.scalars != self.latest.scalars)
+        self.latest = state
+        self.ticks_since_state = 0
+        if scalars_changed:
+            self._show_scalars(state)
+        self._reconcile(state, input_ack)
+
+    def _show_scalars(self, state):
+        """Bring the scoreboard and ship speed up to date."""
+        game = self.game
+        state_index, ships_left, level, score, ship_speed = state.scalars
+        game.stats.state = Snapshot.STATES[state_index]
+        game.stats.ships_left = ships_left
+        game.stats.level = level
+        game.stats.score = score
+        game.settings.ship_speed = ship_speed
+        game.sb.prep_score()
+        game.sb.check_high_score()
+        game.sb.prep_level()
+        game.sb.prep_ships()
+
+    def _reconcile(self, state, input_ack):
+        """Put the local ship where the server has it, plus unused input."""
+        ship = self.game.ships[self.slot]
+        predicted = ship.y
+        while self.pending and self.pending[0][0] <= input_ack:
+            self.pending.popleft()
+        ship.y = state.ships[self.slot] / SCALE
+        ship.rect.y = ship.y
+        if self.game.stats.state == 'playing':
+            for _, bits in self.pending:
+                self._move(ship, bits)
+        self.prediction_errors.append(abs(ship.y - predicted))
+
+    def _move(self, ship, bits):
+        """Move ship for one tick of input, as the server will."""
+        ship.moving_up = bool(bits & UP)
+        ship.moving_down = bool(bits & DOWN)
+        ship.update(self.step)
+
+    def read_input(self):
+        """Return this tick's input bits, from the keys or the bot."""
+        if self.headless:
+            return self._bot_input()
+        bits = 0
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN
+                                             and event.key == pygame.K_q):
+                return None
+            if event.type == pygame.KEYDOWN and event.key == pygame.K_SPACE:
+                self.fire_pressed = True
+        keys = pygame.key.get_pressed()
+        if keys[pygame.K_UP]:
+            bits |= UP
+        if keys[pygame.K_DOWN]:
+            bits |= DOWN
+        if self.fire_pressed:
+            bits |= FIRE
+            self.fire_pressed = False
+        return bits
+
+    def _bot_input(self):
+        """Wander up and down at random and fire steadily."""
+        if self.bot_hold <= 0:
+            self.bot_bits = self.rng.choice((0, UP, DOWN))
+            self.bot_hold = self.rng.randint(10, 200)
+        self.bot_hold -= 1
+        fire = FIRE if self.input_seq % 25 == 0 else 0
+        return self.bot_bits | fire
+
+    def tick(self, bits):
+        """Predict this tick's input locally and send it to the server."""
+        self.input_seq += 1
+        self.pending.append((self.input_seq, bits))
+        self.ticks_since_state += 1
+        if self.latest is not None and self.game.stats.state == 'playing':
+            self._move(self.game.ships[self.slot], bits)
+
+        inputs = list(self.pending)[-INPUT_REDUNDANCY:]
+        state_tick = self.latest.tick if self.latest else NO_BASELINE
+        self.link.sendto(
+            PACKET.pack(MAGIC, VERSION, INPUT)
+            + INPUT_BODY.pack(state_tick, inputs[0][0], len(inputs))
+            + bytes(bits for _, bits in inputs),
+            self.server)
+
+    def draw(self):
+        """Draw the latest state, with the local ship where we predict."""
+        game = self.game
+        screen = game.screen
+        state = self.latest
+        rate = self.settings.sim_rate
+        tick = state.tick + self.ticks_since_state if state else 0
+        game.background.draw(screen, tick / rate)
+        if state is not None:
+            for slot, ship in enumerate(game.ships):
+                if slot != self.slot:
+                    ship.rect.y = state.ships[slot] / SCALE
+                screen.blit(ship.image, ship.rect)
+
+            blits = [(self.bullet_image,
+                      (x / SCALE + direction * speed * (tick - fired) / rate,
+                       y / SCALE))
+                     for direction, x, y, fired, speed
+                     in state.bullets.values()]
+            blits.extend((self.alien_image, (x / SCALE, y / SCALE))
+                         for x, y in state.aliens.values())
+            screen.blits(blits, False)
+
+            game.sb.show_score()
+            if game.stats.state == 'game_over':
+                self.game_over_button.draw_button()
+        pygame.display.flip()
+
+    def run(self, max_ticks=None):
+        """Play until the player quits, the game ends, or max_ticks."""
+        next_tick = next_hello = next_frame = perf_counter()
+        frame_time = 1.0 / self.settings.fps_cap if self.settings.fps_cap else 0
+        ticks = 0
+        over_ticks = 0
+        start = next_tick
+        while max_ticks is None or ticks < max_ticks:
+            now = perf_counter()
+            if self.slot is None and now >= next_hello:
+                self.link.sendto(PACKET.pack(MAGIC, VERSION, HELLO),
+                                 self.server)
+                next_hello = now + 0.25
+            self.receive()
+            self.link.flush()
+            if now < next_tick:
+                sleep(min(next_tick - now, 0.001))
+                continue
+            next_tick = max(next_tick + self.step,
+                            now - self.settings.max_frame_time)
+            if self.slot is None:
+                continue
+
+            bits = self.read_input()
+            if bits is None:
+                break
+            self.tick(bits)
+            ticks += 1
+            if not self.headless and now >= next_frame:
+                self.draw()
+                next_frame = now + frame_time
+            if self.game.stats.state == 'game_over':
+                over_ticks += 1
+                if self.headless and over_ticks > self.settings.sim_rate:
+                    break
+
+        self.link.sendto(PACKET.pack(MAGIC, VERSION, BYE), self.server)
+        self.link.flush()
+        seconds = perf_counter() - start
+        errors = self.prediction_errors or [0.0]
+        return {
+            'slot': self.slot,
+            'ticks': ticks,
+            'score': self.game.stats.score,
+            'states_received': self.states_received,
+            'packets_received': self.received_packets,
+            'bytes_received': self.received_bytes,
+            'kbit_per_second_in': round(self.received_bytes * 8 / 1000
+                                        / max(seconds, 1e-9), 1),
+            'packets_sent': self.link.packets,
+            'dropped': self.link.dropped,
+            'mean_prediction_error_px': round(sum(errors) / len(errors), 3),
+            'max_prediction_error_px': round(max(errors), 3),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[2])
+    parser.add_argument('role', choices=('server', 'client'))
+    parser.add_argument('host', nargs='?', default='127.0.0.1',
+                        help="server to join (client only)")
+    parser.add_argument('--port', type=int, default=5555)
+    parser.add_argument('--players', type=int, choices=(1, 2), default=2,
+                        help="players the server waits for")
+    parser.add_argument('--settings', metavar='FILE',
+                        help="JSON or TOML settings profile (use the same "
+                             "one on every side)")
+    parser.add_argument('--headless', action='store_true',
+                        help="client only: play with a bot and no window")
+    parser.add_argument('--ticks', type=int, default=None,
+                        help="stop after this many ticks")
+    parser.add_argument('--loss', type=float, default=0.0,
+                        help="fraction of sent packets to drop")
+    parser.add_argument('--latency', type=float, default=0.0,
+                        help="seconds to hold back each sent packet")
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help="seconds the latency varies by either way")
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args()
+
+    settings = Settings(args.settings)
+    link_options = {'loss': args.loss, 'latency': args.latency,
+                    'jitter': args.jitter, 'seed': args.seed}
+    if args.role == 'server':
+        server = Server(settings, args.port, args.players, link_options)
+        print("Serving on port {}; waiting for {} player(s)".format(
+            args.port, args.players))
+        summary = server.run(args.ticks)
+    else:
+        client = Client(settings, args.host, args.port, args.headless,
+                        link_options, args.seed)
+        summary = client.run(args.ticks)
+    print(summary)
+
+
+if __name__ == '__main__':
+    main()